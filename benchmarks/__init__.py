@@ -0,0 +1,23 @@
+"""
+Microbenchmarks of dragonfluid, for telling whether a change slows grammar
+loading or per utterance processing. Not part of the installed package.
+
+Run from the repository root, with dragonfly installed::
+
+    python -m benchmarks.run --out before.json
+    python -m benchmarks.run --out after.json
+    python -m benchmarks.compare before.json after.json
+
+Chains are replayed end to end, from a corpus of utterances, with::
+
+    python -m benchmarks.replay benchmarks.replay_sample benchmarks/replay_corpus.txt
+
+The thread safety of registration is stressed with::
+
+    python -m benchmarks.stress --seconds 10
+
+Synthetic grammars of 100, 1k and 10k rules are generated with a fixed seed,
+so runs on the same machine may be compared. A default run takes about half
+a minute. Grammars of 100k rules are left out unless asked for, with
+``--sizes 100,1000,10000,100000``, as they take about four minutes more.
+"""
@@ -0,0 +1,52 @@
+"""
+Stand-ins for dragonfly objects, so that dragonfluid alone is measured.
+"""
+
+
+class FakeContainer(object):
+    """A dictation container whose formatting joins the words with spaces."""
+
+    def __init__(self, words):
+        self.words = list(words)
+
+    def format(self):
+        return " ".join(self.words)
+
+
+class FakeEngine(object):
+    DictationContainer = FakeContainer
+
+    def __init__(self):
+        self.mimicked = []
+
+    def mimic(self, words):
+        self.mimicked.append(words)
+
+
+class FakeNode(object):
+    """The parse tree node a Dictation element is given its value from."""
+
+    def __init__(self, engine, words):
+        self.engine = engine
+        self._words = list(words)
+
+    def words(self):
+        return self._words
+
+
+class SyntheticRule(object):
+    """
+    Carries what `Registry` reads of a `RegisteredRule`, without building a
+    dragonfly rule, which would mostly measure dragonfly.
+    """
+    _is_registered = True
+    _intros = None
+    _determined_intros = None
+    _determined_intro_graph = None
+
+    def __init__(self, name, spec, compact_intros=False):
+        self.name = name
+        self._spec = spec
+        self._intros_spec = None
+        self._compact_intros = compact_intros
+        self._choice_intros = False
@@ -0,0 +1,62 @@
+"""
+Compares two result files written by `benchmarks.run`.
+
+::
+
+    python -m benchmarks.compare before.json after.json [--threshold 1.1]
+
+Each benchmark run in both is listed with the ratio of its time per operation
+after to before. The exit status is 1 if any ratio exceeds the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as results_file:
+        report = json.load(results_file)
+    return dict(((result["name"], result["size"]), result)
+                for result in report["results"])
+
+
+def compare(before, after, threshold):
+    """
+    Returns the report lines for the benchmarks in both, and the number of
+    them slower than the threshold allows.
+    """
+    lines = ["%-45s %7s %12s %12s %7s %10s" % (
+        "benchmark", "size", "before us", "after us", "ratio", "rss kb")]
+    regressions = 0
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        ratio = new["per_operation"] / old["per_operation"] if old["per_operation"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            regressions += 1
+            flag = " slower"
+        rss = "%s>%s" % (old.get("max_rss_kb"), new.get("max_rss_kb"))
+        lines.append("%-45s %7d %12.3f %12.3f %7.2f %10s%s" % (
+            key[0], key[1], old["per_operation"] * 1e6,
+            new["per_operation"] * 1e6, ratio, rss, flag))
+    for key in sorted(set(before) ^ set(after)):
+        lines.append("%-45s %7d only in %s" % (
+            key[0], key[1], "before" if key in before else "after"))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares benchmark results.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="the after to before ratio counted as slower")
+    args = parser.parse_args(argv)
+    lines, regressions = compare(load(args.before), load(args.after), args.threshold)
+    for line in lines:
+        print line
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Generation of synthetic grammars and utterances, seeded so that every run
+generates the same ones.
+"""
+import random
+
+SIZES = (100, 1000, 10000) # run by default; 100000 takes minutes more
+
+_VOCABULARY_SIZE = 2000
+
+
+def vocabulary(seed=0):
+    generator = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < _VOCABULARY_SIZE:
+        words.add("".join(generator.choice(letters)
+                          for _ in xrange(generator.randint(3, 8))))
+    return sorted(words)
+
+
+def specs(count, seed=0):
+    """
+    Returns ``count`` specs in the shapes commands usually take: fixed words,
+    optional words, alternatives, and a trailing extra.
+    """
+    generator = random.Random(seed)
+    words = vocabulary(seed)
+    pick = lambda: generator.choice(words)
+    result = []
+    for _ in xrange(count):
+        parts = [pick() for _ in xrange(generator.randint(1, 3))]
+        shape = generator.random()
+        if shape < 0.3:
+            parts.append("[%s]" % pick())
+        elif shape < 0.5:
+            parts.append("(%s | %s)" % (pick(), pick()))
+        elif shape < 0.6:
+            parts.insert(1, "[%s | %s]" % (pick(), pick()))
+        if generator.random() < 0.5:
+            parts.append("<text>")
+        result.append(" ".join(parts))
+    return result
+
+
+def utterance(length, intros, seed=0, command_every=8):
+    """
+    Returns a word list of dictation with a registered intro embedded about
+    every ``command_every`` words.
+    """
+    generator = random.Random(seed)
+    words = vocabulary(seed + 1) # not the vocabulary of the specs
+    result = []
+    while len(result) < length:
+        if intros and generator.randint(1, command_every) == 1:
+            result += generator.choice(intros).split()
+        else:
+            result.append(generator.choice(words))
+    return result[:length]
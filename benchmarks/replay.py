@@ -0,0 +1,263 @@
+"""
+Replays a corpus of transcribed utterances through grammars offline, and
+reports the latency of each utterance, including every command chained from
+it, along with the mimic round trips and actions of each.
+
+::
+
+    python -m benchmarks.replay GRAMMAR_MODULE CORPUS [--engine fake|text]
+                                [--repeat 3] [--direct-dispatch] [--out replay.json]
+
+GRAMMAR_MODULE is imported after the engine is set up, and each dragonfly
+Grammar at its top level is replayed against. CORPUS is a text file of one
+utterance per line, with lines starting with # skipped. The bundled
+``benchmarks.replay_sample`` and ``benchmarks/replay_corpus.txt`` make an
+example.
+
+The "text" engine is dragonfly's own text engine, where dragonfly has one.
+The "fake" engine, used otherwise, is `ReplayEngine`, which decodes words
+against the grammars' rules itself. Actions are recorded rather than
+executed with either engine, so no keystrokes are sent.
+"""
+import argparse
+import importlib
+import json
+import timeit
+from contextlib import contextmanager
+
+import dragonfly.engines
+from dragonfly import ActionBase, Grammar
+try:
+    from dragonfly import MimicFailure
+except ImportError:
+    class MimicFailure(Exception):
+        pass
+
+from dragonfluid._dispatch import _decode
+from dragonfluid._grammars import Registry
+from dragonfluid._rules import DictationContainerBase
+from dragonfluid._support import _safe_kwargs
+
+PERCENTILES = (50, 95, 99)
+
+
+class ReplayDictationContainer(DictationContainerBase):
+    """
+    A dictation container made from words alone, as dragonfluid makes them,
+    for dragonfly versions whose containers also take formatting methods.
+    """
+
+    def __init__(self, words):
+        _safe_kwargs(DictationContainerBase.__init__, self, words=words, methods=[])
+
+
+class ReplayEngine(object):
+    """
+    A stand-in engine that recognizes mimicked words by decoding them against
+    the active rules of the grammars loaded into it, the first rule to parse
+    them taking them. Grammars load and activate their rules as they would
+    with a real engine, so a `RegistryGrammar` registers its rules, and they
+    can be dispatched to directly. Contexts are not consulted.
+    """
+    DictationContainer = ReplayDictationContainer
+    language = "en" # read by number elements as their grammars are built
+
+    def __init__(self):
+        self.grammars = []
+
+    def add_grammar(self, grammar):
+        """Loads the grammar, which must have been created with this engine."""
+        if grammar.engine is not self:
+            raise ValueError("grammar %r belongs to another engine" % grammar.name)
+        if not grammar.loaded:
+            grammar.load()
+
+    # called by dragonfly grammars
+    def load_grammar(self, grammar):
+        if grammar not in self.grammars:
+            self.grammars.append(grammar)
+
+    def unload_grammar(self, grammar):
+        if grammar in self.grammars:
+            self.grammars.remove(grammar)
+
+    def activate_rule(self, rule, grammar):
+        pass
+
+    def deactivate_rule(self, rule, grammar):
+        pass
+
+    def update_list(self, lst, grammar):
+        pass
+
+    def set_exclusiveness(self, grammar, exclusive):
+        pass
+
+    def mimic(self, words):
+        if isinstance(words, basestring):
+            words = words.split()
+        for grammar in self.grammars:
+            for rule in grammar.rules:
+                if not (rule.active and getattr(rule, "exported", True)):
+                    continue
+                root = _decode(rule, self, list(words))
+                if root is not None:
+                    rule.process_recognition(root)
+                    return
+        raise MimicFailure("No matching rule found for words %r." % (words,))
+
+
+class _Recorder(object):
+    def __init__(self):
+        self.mimics = []
+        self.actions = []
+
+
+@contextmanager
+def _recording(engine, recorder):
+    # counts every mimic, and records actions in place of executing them
+    original_mimic = engine.mimic
+    original_execute = ActionBase.execute
+    def mimic(words):
+        recorder.mimics.append(" ".join(words) if not isinstance(words, basestring) else words)
+        return original_mimic(words)
+    def execute(action, data=None):
+        recorder.actions.append(repr(action))
+        return True
+    engine.mimic = mimic
+    ActionBase.execute = execute
+    try:
+        yield
+    finally:
+        engine.mimic = original_mimic
+        ActionBase.execute = original_execute
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest rank percentile of the sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[int(rank)]
+
+
+def replay(engine, utterances, repeat=1):
+    """
+    Mimics each utterance ``repeat`` times, and returns the report of its
+    latencies, mimic round trips and actions.
+    """
+    records = []
+    latencies = []
+    for utterance in utterances:
+        times = []
+        for _ in xrange(repeat):
+            recorder = _Recorder()
+            error = None
+            with _recording(engine, recorder):
+                start = timeit.default_timer()
+                try:
+                    engine.mimic(utterance.split())
+                except MimicFailure as failure:
+                    error = str(failure)
+                times.append(timeit.default_timer() - start)
+        latencies += times
+        records.append({"utterance": utterance,
+                        "seconds": sorted(times)[len(times) // 2],
+                        # the first mimic stands in for speech
+                        "round_trips": len(recorder.mimics) - 1,
+                        "mimics": recorder.mimics[1:],
+                        "actions": recorder.actions,
+                        "error": error})
+    latencies.sort()
+    summary = dict(("p%d" % percent, percentile(latencies, percent))
+                   for percent in PERCENTILES)
+    summary["utterances"] = len(utterances)
+    summary["round_trips"] = sum(record["round_trips"] for record in records)
+    summary["errors"] = sum(1 for record in records if record["error"])
+    return {"summary": summary, "utterances": records}
+
+
+def read_corpus(path):
+    with open(path) as corpus:
+        lines = (line.strip() for line in corpus)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def text_engine():
+    """
+    Returns dragonfly's text engine, or None if it has none.
+
+    The text engine only takes words in upper case as dictation, so each
+    mimic is tried with the last words in upper case, from none of them to
+    all of them, until one is recognized. Its latencies include these tries.
+    """
+    try:
+        from dragonfly import get_engine
+        engine = get_engine("text")
+    except Exception:
+        return None
+    engine.DictationContainer = ReplayDictationContainer
+    text_mimic = engine.mimic
+    def mimic(words):
+        if isinstance(words, basestring):
+            words = words.split()
+        words = list(words)
+        for rule_word_count in xrange(len(words), -1, -1):
+            try:
+                return text_mimic(words[:rule_word_count] +
+                                  [word.upper() for word in words[rule_word_count:]])
+            except MimicFailure:
+                pass
+        raise MimicFailure("No matching rule found for words %r." % (words,))
+    engine.mimic = mimic
+    return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays utterances offline.")
+    parser.add_argument("grammar_module")
+    parser.add_argument("corpus")
+    parser.add_argument("--engine", choices=("fake", "text"), default="fake")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--direct-dispatch", action="store_true",
+                        help="sets Registry.direct_dispatch for every registry")
+    parser.add_argument("--out", help="the file to write the JSON report to")
+    args = parser.parse_args(argv)
+    Registry.direct_dispatch = args.direct_dispatch
+
+    if args.engine == "text":
+        engine = text_engine()
+        if engine is None:
+            parser.error("this dragonfly has no text engine")
+    else:
+        engine = ReplayEngine()
+        # grammars take the default engine as they're created
+        dragonfly.engines._default_engine = engine
+    module = importlib.import_module(args.grammar_module) # after the engine
+    for grammar in vars(module).values():
+        if isinstance(grammar, Grammar):
+            if args.engine == "text":
+                if not grammar.loaded:
+                    grammar.load()
+            else:
+                engine.add_grammar(grammar)
+
+    utterances = read_corpus(args.corpus)
+    if not utterances:
+        parser.error("no utterances in " + args.corpus)
+    report = replay(engine, utterances, args.repeat)
+    summary = report["summary"]
+    for record in report["utterances"]:
+        print "%8.3f ms %2d trips  %s%s" % (
+            record["seconds"] * 1e3, record["round_trips"], record["utterance"],
+            "  (%s)" % record["error"] if record["error"] else "")
+    print "p50 %.3f ms, p95 %.3f ms, p99 %.3f ms, %d round trips, %d errors" % (
+        summary["p50"] * 1e3, summary["p95"] * 1e3, summary["p99"] * 1e3,
+        summary["round_trips"], summary["errors"])
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(report, out_file, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+A small grammar to replay `benchmarks/replay_corpus.txt` against.
+"""
+from dragonfly import Dictation, IntegerRef, Key, Text
+
+from dragonfluid import ActiveGrammarRule, FluidRule, GlobalRegistry, QuickFluidRules
+
+grammar = GlobalRegistry("replay sample")
+
+
+@ActiveGrammarRule(grammar)
+class SayRule(FluidRule):
+    spec = "say <text>"
+    extras = (Dictation("text"),)
+
+    def _process_recognition(self, node, extras):
+        Text(extras["text"].format()).execute()
+
+
+@ActiveGrammarRule(grammar)
+class KeysRules(QuickFluidRules):
+    extras = (IntegerRef("n", 1, 10),)
+    mapping = {
+        "press enter": Key("enter"),
+        "press tab": Key("tab"),
+        "tab <n> times": Key("tab:%(n)d"),
+        "go (up | down) [line]": Key("up"),
+        "select all": Key("c-a"),
+        "copy that": Key("c-c"),
+        "paste that": Key("c-v"),
+    }
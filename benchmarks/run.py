@@ -0,0 +1,217 @@
+"""
+Runs the benchmarks and writes the results as JSON.
+
+::
+
+    python -m benchmarks.run [--sizes 100,1000] [--repeat 5] [--out results.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+from collections import OrderedDict
+
+from benchmarks import grammars
+from benchmarks._fakes import FakeEngine, FakeNode, SyntheticRule
+from dragonfluid import Registry, SplitDictation
+from dragonfluid import _specparsers
+from dragonfluid._specparsers import _XmlSpecParser
+
+RESULTS_FORMAT = 1
+UTTERANCE_LENGTHS = (5, 20, 80, 320)
+UTTERANCE_COUNT = 50
+SINGLE_RULES = 100 # registered one at a time into a registry of each size
+
+_SPLIT_PROPERTIES = [
+    "full", "full_trans", "full_words", "full_words_trans", "full_container",
+    "full_container_trans", "dictation", "dictation_notrans",
+    "dictation_words", "dictation_words_notrans", "dictation_container",
+    "dictation_container_trans", "command", "command_trans", "command_words",
+    "command_words_trans", "command_container", "command_container_trans",
+]
+
+
+def max_rss_kb():
+    """
+    Returns the peak resident memory of the process so far in kilobytes, or
+    None where that can't be had.
+    """
+    try:
+        import resource
+    except ImportError: # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset // 1024
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024 # bytes rather than kilobytes
+    return peak
+
+
+def measure(function, repeat, operations=1):
+    """
+    Calls the function ``repeat`` times, returning a result dict of timings
+    per call and per operation, and the memory peak reached.
+    """
+    times = []
+    for _ in xrange(repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    times.sort()
+    median = times[len(times) // 2]
+    return {"min": times[0], "median": median, "max": times[-1],
+            "operations": operations,
+            "per_operation": median / operations,
+            "max_rss_kb": max_rss_kb()}
+
+
+def bench_registration(size, repeat):
+    specs = grammars.specs(size)
+    results = OrderedDict()
+    for compact in (False, True):
+        rules = [SyntheticRule("rule%d" % i, spec, compact)
+                 for i, spec in enumerate(specs)]
+        suffix = "_compact" if compact else ""
+        registries = []
+        def register():
+            registry = Registry()
+            for rule in rules:
+                registry.register_rule(rule)
+            registries.append(registry)
+        # intros are memoized on each rule, the first time they're registered
+        results["register_rule_first" + suffix] = measure(register, 1, size)
+        results["register_rule" + suffix] = measure(register, repeat, size)
+        def unregister():
+            registry = registries.pop()
+            for rule in rules:
+                registry.unregister_rule(rule)
+        results["unregister_rule" + suffix] = measure(unregister, repeat, size)
+    return results
+
+
+def bench_single_registration(size, repeat):
+    """
+    Times registering and unregistering rules one at a time in a registry
+    already holding ``size`` rules. The time per rule should not grow with
+    the size, as registering one rule must not copy the whole registry.
+    """
+    specs = grammars.specs(size + SINGLE_RULES)
+    rules = [SyntheticRule("rule%d" % i, spec) for i, spec in enumerate(specs)]
+    registry = Registry()
+    registry._register_rules(rules) # memoizes the intros of all
+    single_rules = rules[size:]
+    for rule in single_rules:
+        registry.unregister_rule(rule)
+    def toggle():
+        for rule in single_rules:
+            registry.register_rule(rule)
+        for rule in single_rules:
+            registry.unregister_rule(rule)
+    return {"register_unregister_one_at_a_time":
+            measure(toggle, repeat, 2 * len(single_rules))}
+
+
+def bench_parsing(size, repeat):
+    specs = grammars.specs(size)
+    def parse():
+        _specparsers._group_memo.clear() # as on a fresh load
+        for spec in specs:
+            _XmlSpecParser(spec).get_intros()
+    return {"get_intros": measure(parse, repeat, size)}
+
+
+def _registry_of(size):
+    registry = Registry()
+    registry.split_cache_size = 0 # each call does the work
+    rules = [SyntheticRule("rule%d" % i, spec)
+             for i, spec in enumerate(grammars.specs(size))]
+    registry._register_rules(rules) # in one batch, as a bulk load does
+    intros = []
+    for rule in rules:
+        intros += registry._get_intros(rule)
+    registry._snapshot.build_automaton() # rather than wait for the builder thread
+    return registry, intros
+
+
+def bench_splitting(size, repeat):
+    registry, intros = _registry_of(size)
+    results = OrderedDict()
+    for length in UTTERANCE_LENGTHS:
+        utterances = [grammars.utterance(length, intros, seed)
+                      for seed in xrange(UTTERANCE_COUNT)]
+        def split():
+            for words in utterances:
+                registry._determine_command_index(words)
+        results["determine_command_index_%d_words" % length] = (
+            measure(split, repeat, len(utterances)))
+    return results
+
+
+def bench_split_dictation(size, repeat):
+    registry, intros = _registry_of(size)
+    engine = FakeEngine()
+    element = SplitDictation("text", registry=registry)
+    results = OrderedDict()
+    for length in UTTERANCE_LENGTHS:
+        nodes = [FakeNode(engine, grammars.utterance(length, intros, seed))
+                 for seed in xrange(UTTERANCE_COUNT)]
+        def access():
+            for node in nodes:
+                value = element.value(node)
+                for name in _SPLIT_PROPERTIES:
+                    getattr(value, name)
+        results["split_dictation_properties_%d_words" % length] = (
+            measure(access, repeat, len(nodes)))
+    return results
+
+
+BENCHMARKS = [bench_registration, bench_single_registration, bench_parsing,
+              bench_splitting, bench_split_dictation]
+
+
+def run(sizes, repeat, log=None):
+    results = []
+    for size in sizes:
+        for benchmark in BENCHMARKS:
+            for name, result in benchmark(size, repeat).iteritems():
+                result.update(name=name, size=size)
+                results.append(result)
+                if log:
+                    log("%-45s %7d %12.3f us/op" % (
+                        name, size, result["per_operation"] * 1e6))
+    return {"format": RESULTS_FORMAT,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "results": results}
+
+
+def _print(line):
+    print line
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs dragonfluid benchmarks.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in grammars.SIZES),
+                        help="comma separated rule counts of the grammars")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="the file to write the JSON results to")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = run(sizes, args.repeat, log=_print)
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(report, out_file, indent=1, sort_keys=True)
+    else:
+        _print(json.dumps(report, indent=1, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
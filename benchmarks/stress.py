@@ -0,0 +1,114 @@
+"""
+A concurrency stress test of `Registry`, checking that threads splitting
+utterances never see a registration half applied while other threads
+register and unregister rules.
+
+::
+
+    python -m benchmarks.stress [--seconds 10] [--readers 4]
+
+The exit status is 1 if any reader saw some, but not all, of the intros of a
+rule, or lost sight of a rule registered throughout.
+
+A bounded run of the same check is part of the tests, in
+``tests/test_grammars.py``.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from benchmarks._fakes import SyntheticRule
+from dragonfluid import Registry
+
+# registered and unregistered over and over, all three intros at once
+TOGGLED_SPEC = "alpha (one | two | three)"
+# registered throughout
+STEADY_SPEC = "zulu"
+UTTERANCE = "alpha one and alpha two and alpha three then zulu".split()
+TOGGLED_STARTS = set([0, 3, 6])
+STEADY_START = 9
+
+
+class _Reader(threading.Thread):
+    def __init__(self, registry, stop):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.registry = registry
+        self.stop = stop
+        self.reads = 0
+        self.failures = []
+
+    def run(self):
+        registry = self.registry
+        while not self.stop.is_set():
+            starts = set(registry._determine_command_lengths(UTTERANCE))
+            self.check("lengths", starts)
+            starts = set(segment.start for segment in registry.segment(UTTERANCE)
+                         if segment.kind == "command")
+            self.check("segment", starts)
+            index = registry._determine_command_index(UTTERANCE)
+            if index not in (0, STEADY_START):
+                self.failures.append(("command index", index))
+            self.reads += 1
+
+    def check(self, name, starts):
+        toggled = starts & TOGGLED_STARTS
+        if toggled and toggled != TOGGLED_STARTS or STEADY_START not in starts:
+            self.failures.append((name, sorted(starts)))
+
+
+class _Writer(threading.Thread):
+    def __init__(self, registry, stop, rules):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.registry = registry
+        self.stop = stop
+        self.rules = rules
+        self.writes = 0
+
+    def run(self):
+        while not self.stop.is_set():
+            for rule in self.rules:
+                self.registry.register_rule(rule)
+            for rule in self.rules:
+                self.registry.unregister_rule(rule)
+            self.writes += 1
+
+
+def stress(seconds, reader_count):
+    """Returns the reader failures, and the read and write counts."""
+    registry = Registry()
+    registry.register_rule(SyntheticRule("steady", STEADY_SPEC))
+    stop = threading.Event()
+    readers = [_Reader(registry, stop) for _ in range(reader_count)]
+    writers = [_Writer(registry, stop, [SyntheticRule("toggled", TOGGLED_SPEC)]),
+               # churns other intros, so updates overlap in the index
+               _Writer(registry, stop, [SyntheticRule("churn%d" % i, "alpha one churn %d" % i)
+                                        for i in range(20)])]
+    for thread in readers + writers:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in readers + writers:
+        thread.join()
+    failures = [failure for reader in readers for failure in reader.failures]
+    return (failures, sum(reader.reads for reader in readers),
+            sum(writer.writes for writer in writers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stresses Registry with threads.")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args(argv)
+    sys.setcheckinterval(10) # switch threads often
+    failures, reads, writes = stress(args.seconds, args.readers)
+    print "%d reads, %d write rounds, %d inconsistent reads" % (reads, writes, len(failures))
+    for failure in failures[:10]:
+        print "  %s saw commands at %s" % failure
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,4 +7,5 @@ from dragonfluid._rules      import (FluidRule, QuickFluidRules, RegisteredRule,
                                      ContinuingRule, QuickFluidRule)
 from dragonfluid._elements   import SplitDictation, SplitForcedDictation
 from dragonfluid._grammars   import GlobalRegistry, RegistryGrammar, Registry
-from dragonfluid._decorators import ActiveGrammarRule
\ No newline at end of file
+from dragonfluid._decorators import ActiveGrammarRule
+from dragonfluid._executor   import ActionExecutor, CancelPendingActions
\ No newline at end of file
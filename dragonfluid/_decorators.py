@@ -1,5 +1,6 @@
 from dragonfluid._grammars import RegistryGrammar
 from dragonfluid._elements import _RegistryElement
+from dragonfluid._loadprofile import _load_stage
 from dragonfluid._rules import _BaseQuickRules
 
 # decorator
@@ -44,8 +45,9 @@ def ActiveGrammarRule(grammar):
                     if extra._registry is None:
                         extra.registry = grammar.registry
                 
-        if issubclass(rule_class, _BaseQuickRules):
-            rule_class(grammar)
-        else:
-            grammar.add_rule(rule_class())
+        with _load_stage("instantiate", rule_class):
+            if issubclass(rule_class, _BaseQuickRules):
+                rule_class(grammar)
+            else:
+                grammar.add_rule(rule_class())
     return AddToGrammar
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+Direct dispatch of chained commands to the registered rule they belong to,
+used by `Registry` in place of a round trip through engine mimic, and the
+execution of chains a command at a time.
+"""
+import traceback
+
+try:
+    from dragonfly.grammar.state import State
+except ImportError: # dispatch is then never direct
+    State = None
+try:
+    from dragonfly import MimicFailure
+    _MIMIC_FAILURES = (MimicFailure,)
+except ImportError:
+    _MIMIC_FAILURES = ()
+from dragonfly import Dictation
+
+from dragonfluid._executor import _mimicking
+from dragonfluid._instrumentation import _timed
+from dragonfluid._support import _contexts_of
+
+# the rule id engines give to words recognized as free dictation
+_DICTATION_RULE_ID = 1000000
+
+
+class _Dispatcher(object):
+    """
+    Routes command words to the registered rule whose intro they begin with,
+    decoding them against the rule's element tree and processing the
+    recognition in process, much as an engine does after recognition.
+
+    Words are only dispatched when exactly one rule could take them, and
+    that rule is active and free of contexts, which can't be judged outside
+    of the engine. Otherwise the caller is left to mimic them.
+    """
+
+    def __init__(self, registry):
+        self._registry = registry
+        # replaced whole, so readers on other threads see all of one table:
+        # the registry snapshot generation it was built from, intro word
+        # tuple to the rules with the intro, the intro lengths, and (graph,
+        # rule) of compact intros rules
+        self._table = (None, {}, [], [])
+
+    @_timed("dispatch")
+    def dispatch(self, engine, words):
+        """
+        Processes the words with the one rule they belong to and returns
+        True, or returns False if that can't be done with certainty.
+        """
+        if State is None or not words:
+            return False
+        candidates = self._candidates(words)
+        if not candidates or not all(_is_dispatchable(rule) for rule in candidates):
+            return False
+        matches = []
+        for rule in candidates:
+            root = _decode(rule, engine, words)
+            if root is not None:
+                matches.append((rule, root))
+        if len(matches) != 1:
+            return False
+        rule, root = matches[0]
+        try:
+            rule.process_recognition(root)
+        except Exception:
+            # as the engine would, rather than fail the rule chaining here
+            traceback.print_exc()
+        return True
+
+    def _candidates(self, words):
+        snapshot = self._registry._snapshot
+        if self._table[0] != snapshot.generation:
+            self._table = self._build_table(snapshot)
+        generation, intro_rules, intro_lengths, graph_rules = self._table
+        candidates = []
+        for length in intro_lengths:
+            if length > len(words):
+                break
+            for rule in intro_rules.get(tuple(words[:length]), ()):
+                if rule not in candidates:
+                    candidates.append(rule)
+        for graph, rule in graph_rules:
+            if rule not in candidates and graph.starts_with(words):
+                candidates.append(rule)
+        return candidates
+
+    def _build_table(self, snapshot):
+        registry = self._registry
+        intro_rules = {}
+        graph_rules = []
+        for rule in snapshot.rules:
+            graph = registry._get_intro_graph(rule)
+            if graph is not None:
+                graph_rules.append((graph, rule))
+                continue
+            for intro in registry._get_intros(rule) or []:
+                rules = intro_rules.setdefault(tuple(intro.split()), [])
+                if rule not in rules:
+                    rules.append(rule)
+        intro_lengths = sorted(set(len(intro) for intro in intro_rules))
+        return snapshot.generation, intro_rules, intro_lengths, graph_rules
+
+
+class _ExecutionPlan(object):
+    """
+    The commands chained in a word list, split up by `Registry.segment` in a
+    single pass, to be processed one after another. As each command is
+    processed on its own words only, none of them splits the words again.
+
+    Any words before the first command go along with it. Should a command's
+    words not be recognized on their own, they are taken together with the
+    next command's, as they would have been in a single mimic.
+    """
+
+    def __init__(self, registry, engine, words):
+        self._registry = registry
+        self._engine = engine
+        starts = [segment.start for segment in registry.segment(words)
+                  if segment.kind == "command"]
+        boundaries = [0] + starts[1:] + [len(words)]
+        self.steps = [list(words[start:end]) for start, end
+                      in zip(boundaries, boundaries[1:]) if start < end]
+
+    @_timed("chain")
+    def run(self):
+        steps = list(self.steps)
+        while steps:
+            words = steps.pop(0)
+            try:
+                if not self._registry._dispatch(self._engine, words):
+                    with _mimicking():
+                        self._engine.mimic(words)
+            except _MIMIC_FAILURES:
+                if not steps:
+                    raise
+                steps[0] = words + steps[0]
+
+
+def _is_dispatchable(rule):
+    grammar = getattr(rule, "grammar", None)
+    return (grammar is not None
+            and getattr(rule, "active", False)
+            and getattr(rule, "exported", True)
+            and not _contexts_of(rule)
+            and getattr(grammar, "enabled", True))
+
+
+def _decode(rule, engine, words):
+    """
+    Returns the root node of the rule's parse of the words, or None.
+
+    Engines mark which words were dictated, but the words given were
+    formatted rather than recognized, so the marking is found by decoding:
+    only Dictation elements look at the marking, so the words are first
+    decoded all marked as dictated, and the words before the first one a
+    Dictation element took are then marked as the rule's own for the parse
+    returned. Each call so decodes the words twice, however many there are.
+    """
+    rule_names = list(getattr(rule.grammar, "_rule_names", None) or [rule.name])
+    if rule.name not in rule_names:
+        rule_names.append(rule.name)
+    root = _decode_marked(rule, engine, words, rule_names, 0)
+    if root is None:
+        return None
+    rule_word_count = _first_dictated(root, len(words))
+    if not rule_word_count:
+        return None
+    return _decode_marked(rule, engine, words, rule_names, rule_word_count)
+
+
+def _decode_marked(rule, engine, words, rule_names, rule_word_count):
+    # the parse with the first so many words marked the rule's, else None
+    rule_id = rule_names.index(rule.name)
+    results = [(word, rule_id) for word in words[:rule_word_count]]
+    results += [(word, _DICTATION_RULE_ID) for word in words[rule_word_count:]]
+    state = State(results, rule_names, engine)
+    state.initialize_decoding()
+    for _ in rule.decode(state):
+        if state.finished():
+            return state.build_parse_tree()
+    return None
+
+
+def _first_dictated(root, word_count):
+    # the index of the first word a Dictation element took, else word_count
+    first = word_count
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node.actor, Dictation):
+            first = min(first, node.begin)
+        else:
+            nodes.extend(node.children)
+    return first
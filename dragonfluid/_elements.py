@@ -1,8 +1,15 @@
 from dragonfly import Dictation
 
+from dragonfluid._dispatch import _ExecutionPlan
+from dragonfluid._executor import _mimicking
 from dragonfluid._grammars import GlobalRegistry
+from dragonfluid._instrumentation import _timed
 from dragonfluid._support import _safe_kwargs
 
+# the raw words before a raw word formatted with it when counting the
+# formatted words it adds
+_ALIGNMENT_CONTEXT = 3
+
 
 class _RegistryElement(object):
     # An internal object used to indicate that the element has a _registry
@@ -29,10 +36,10 @@ class SplitDictation(_RegistryElement, Dictation):
                 name_split = extras["name_split"]
                 name = name_split.dictation
                 
-    The result is a type of container from which parts of the result may be
-    retrieved. The full list of attributes are individually documented below,
-    but a simple naming scheme is in place. The first part of the attribute
-    name indicates the part desired:
+    The result is a `SplitDictationResult`, a container from which parts of the
+    result may be retrieved. The full list of its attributes are individually
+    documented there, but a simple naming scheme is in place. The first part
+    of the attribute name indicates the part desired:
     
     * **full** - The entire utterance
     * **dictation** - The utterance only up to the first accepted command, may
@@ -102,17 +109,56 @@ class SplitDictation(_RegistryElement, Dictation):
     def registry(self, value):
         self._registry = value
     
+    @_timed("split_dictation")
     def value(self, node):
         # The element instance lives on between invocations of the rule in
-        # which it lives. This value method is called from each invocation to
-        # obtain the *current* value. Therefore below we reset any state so
-        # that elements retrieved respect the `node` passed in.
-        
-        self._node = node # store the context node from which to parse values
-        # clear memoize variables of any previous values
-        self._formatted_words_list_memo = None
-        self._command_index_memo = None
-        return self
+        # which it lives, so the value of each invocation is a separate
+        # object, which keeps neither this element nor the node.
+        return SplitDictationResult(node.engine, self.registry, node.words(),
+                                    self._forced_dictation)
+    
+    def translate(self, words_iterable):
+        """Returns a word list, as translated."""
+        return self.registry.translate_literals(words_iterable)
+
+
+class SplitDictationResult(object):
+    """
+    The value of a `SplitDictation` element for a single recognition. It is
+    immutable, and each of its parts is produced on first request only.
+    
+    The words are formatted and searched for a command once, as the result is
+    created, with the literal tags among them noted. Word lists returned are
+    shared between requests, and should not be altered.
+    
+    Containers hold the raw words the engine recognized, which formatting may
+    have merged or split. The raw words of a part are those the formatted words
+    of the part came from, with a raw word split across the dictation and
+    command parts going to the command.
+    """
+    __slots__ = ("_engine", "_registry", "_raw_words", "_words",
+                 "_literal_tag_indices", "_command_index", "_memo")
+    
+    def __init__(self, engine, registry, raw_words, forced_dictation=False):
+        """
+        :param engine: The engine that recognized the words.
+        :param `Registry` registry: Determines the commands and literal tags.
+        :param raw_words: The words recognized, as given by the engine.
+        :param bool forced_dictation: As for `SplitDictation`.
+        """
+        set_slot = lambda name, value: object.__setattr__(self, name, value)
+        raw_words = tuple(raw_words)
+        words = _format_words(engine, raw_words)
+        set_slot("_engine", engine)
+        set_slot("_registry", registry)
+        set_slot("_raw_words", raw_words)
+        set_slot("_words", words)
+        set_slot("_literal_tag_indices", frozenset(registry._get_literal_tag_indices(words)))
+        set_slot("_command_index", registry._determine_command_index(words, forced_dictation))
+        set_slot("_memo", {})
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("SplitDictationResult is immutable")
     
     @property
     def command_index(self):
@@ -123,32 +169,29 @@ class SplitDictation(_RegistryElement, Dictation):
         utterance-initial command will be skipped to ensure dictation content
         is non-empty.
         """
-        if self._command_index_memo is None:        
-            command_index = self.registry._determine_command_index(self._formatted_words_list)
-            if self._forced_dictation and command_index == 0:
-                # do not allow empty dictation bypass utterance-initial command
-                next_command_index = self.registry._determine_command_index(self._formatted_words_list[1:])
-                if next_command_index is not None:
-                    command_index = next_command_index + 1
-                else:
-                    # return index beyond last as None indicator
-                    command_index = len(self._formatted_words_list)
-            self._command_index_memo = command_index             
-        return self._command_index_memo
+        return self._command_index
     
     def translate(self, words_iterable):
         """Returns a word list, as translated."""
-        return self.registry.translate_literals(words_iterable)    
+        return self._registry.translate_literals(words_iterable)
     
+    @_timed("mimic")
     def mimic_command(self):
         command = self.command_words_notrans
-        if command:
-            self._node.engine.mimic(command)
+        if command and not self._registry._dispatch(self._engine, command):
+            with _mimicking():
+                self._engine.mimic(command)
         
+    @_timed("mimic")
     def mimic_full(self):
         full = self.full_words_notrans
-        if full:
-            self._node.engine.mimic(full)    
+        if full and not self._registry._dispatch(self._engine, full):
+            with _mimicking():
+                self._engine.mimic(full)    
+    
+    def _execution_plan(self, full=False):
+        words = self.full_words_notrans if full else self.command_words_notrans
+        return _ExecutionPlan(self._registry, self._engine, words)
     
     @property
     def full(self):
@@ -160,8 +203,8 @@ class SplitDictation(_RegistryElement, Dictation):
         """
         Returns the full content, as a string, with formatting applied and with
         literal tags retained.
-        """        
-        return " ".join(self.full_words_notrans)
+        """
+        return self._string("full", False)
     
     @property
     def full_trans(self):
@@ -169,7 +212,7 @@ class SplitDictation(_RegistryElement, Dictation):
         Returns the full content, as a string, with formatting applied and with
         literal tags translated to their intended result.
         """
-        return " ".join(self.full_words_trans)
+        return self._string("full", True)
     
     @property
     def full_words(self):
@@ -181,8 +224,8 @@ class SplitDictation(_RegistryElement, Dictation):
         """
         Returns the full content, as a word list, with formatting applied and
         with literal tags retained.
-        """        
-        return self._formatted_words_list
+        """
+        return self._words_list("full", False)
     
     @property
     def full_words_trans(self):
@@ -190,11 +233,11 @@ class SplitDictation(_RegistryElement, Dictation):
         Returns the full content, as a word list, with formatting applied and
         with literal tags translated to their intended result.
         """
-        return self.translate(self.full_words_notrans)
-
+        return self._words_list("full", True)
+    
     @property
     def full_container(self):
-        """Alias for `full_container_notrans`.""" 
+        """Alias for `full_container_notrans`."""
         return self.full_container_notrans
     
     @property
@@ -204,7 +247,7 @@ class SplitDictation(_RegistryElement, Dictation):
         appropriate type given the speech recognition system in use, without
         any alterations of any sort applied to the container contents. 
         """
-        return self._node.engine.DictationContainer(self._node.words())
+        return self._container("full", False)
     
     @property
     def full_container_trans(self):
@@ -213,10 +256,7 @@ class SplitDictation(_RegistryElement, Dictation):
         appropriate type given the speech recognition system in use, with no
         formatting applied yet with literal tags translated to their intended result. 
         """
-        tag_indices = self.registry._get_literal_tag_indices(self.full_words_notrans)
-        notrans_words = self._node.words()
-        translated_words = [notrans_words[i] for i in range(len(notrans_words)) if i not in tag_indices]
-        return self._node.engine.DictationContainer(translated_words)
+        return self._container("full", True)
     
     @property
     def dictation(self):
@@ -229,8 +269,8 @@ class SplitDictation(_RegistryElement, Dictation):
         Returns any and all content up to the first full command intro, if any.
         Content is returned as a string with formatting and with literal tags
         translated to their intended result.
-        """        
-        return " ".join(self.dictation_words_trans)
+        """
+        return self._string("dictation", True)
     
     @property
     def dictation_notrans(self):
@@ -239,11 +279,11 @@ class SplitDictation(_RegistryElement, Dictation):
         Content is returned as a string with formatting and with literal tags
         retained.
         """
-        return " ".join(self.dictation_words_notrans)
+        return self._string("dictation", False)
     
     @property
     def dictation_words(self):
-        """Alias for `dictation_words_trans`."""    
+        """Alias for `dictation_words_trans`."""
         return self.dictation_words_trans
     
     @property
@@ -252,8 +292,8 @@ class SplitDictation(_RegistryElement, Dictation):
         Returns any and all content up to the first full command intro, if any.
         Content is returned as a word list with formatting and with literal
         tags translated to their intended result.
-        """        
-        return self.translate(self.dictation_words_notrans)
+        """
+        return self._words_list("dictation", True)
     
     @property
     def dictation_words_notrans(self):
@@ -261,8 +301,8 @@ class SplitDictation(_RegistryElement, Dictation):
         Returns any and all content up to the first full command intro, if any.
         Content is returned as a word list with formatting and with literal
         tags retained.
-        """        
-        return self._formatted_words_list[:self.command_index]
+        """
+        return self._words_list("dictation", False)
     
     @property
     def dictation_container(self):
@@ -277,7 +317,7 @@ class SplitDictation(_RegistryElement, Dictation):
         given the speech recognition system in use, without any alterations
         of any sort applied to the container contents. 
         """
-        return self._node.engine.DictationContainer(self._node.words()[:self.command_index])    
+        return self._container("dictation", False)
     
     @property
     def dictation_container_trans(self):
@@ -287,10 +327,7 @@ class SplitDictation(_RegistryElement, Dictation):
         given the speech recognition system in use, with no formatting applied
         yet with literal tags translated to their intended result.   
         """
-        tag_indices = self.registry._get_literal_tag_indices(self.dictation_words_notrans)
-        notrans_words = self._node.words()[:self.command_index]
-        translated_words = [notrans_words[i] for i in range(len(notrans_words)) if i not in tag_indices]
-        return self._node.engine.DictationContainer(translated_words)
+        return self._container("dictation", True)
     
     @property
     def command(self):
@@ -304,22 +341,22 @@ class SplitDictation(_RegistryElement, Dictation):
         any. Content is returned as a string with formatting and with literal
         tags retained.
         """
-        return " ".join(self.command_words)
+        return self._string("command", False)
     
     @property
     def command_trans(self):
         """
         Returns any and all content starting from first full command intro, if
         any. Content is returned as a string with formatting and with literal
-        tags retained.
+        tags translated to their intended result.
         """
-        return " ".join(self.command_words_trans)    
+        return self._string("command", True)
     
     @property
     def command_words(self):
         """Alias for `command_words_notrans`"""
         return self.command_words_notrans
-
+    
     @property
     def command_words_notrans(self):
         """
@@ -327,7 +364,7 @@ class SplitDictation(_RegistryElement, Dictation):
         any. Content is returned as a word list with formatting and with
         literal tags retained.
         """
-        return self._formatted_words_list[self.command_index:]
+        return self._words_list("command", False)
     
     @property
     def command_words_trans(self):
@@ -336,13 +373,13 @@ class SplitDictation(_RegistryElement, Dictation):
         any. Content is returned as a word list with formatting and with
         literal tags translated to their intended result.
         """
-        return self.translate(self.command_words)    
+        return self._words_list("command", True)
     
     @property
     def command_container(self):
         """Alias for `command_container_notrans`"""
         return self.command_container_notrans
-
+    
     @property
     def command_container_notrans(self):
         """
@@ -351,7 +388,7 @@ class SplitDictation(_RegistryElement, Dictation):
         type given the speech recognition system in use, without any
         alterations of any sort applied to the container contents.
         """
-        return self._node.engine.DictationContainer(self._node.words()[self.command_index:])
+        return self._container("command", False)
     
     @property
     def command_container_trans(self):
@@ -361,16 +398,111 @@ class SplitDictation(_RegistryElement, Dictation):
         type given the speech recognition system in use, with no formatting
         applied yet with literal tags translated to their intended result.  
         """
-        tag_indices = self.registry._get_literal_tag_indices(self.command_words_notrans)
-        notrans_words = self._node.words()[self.command_index:]
-        translated_words = [notrans_words[i] for i in range(len(notrans_words)) if i not in tag_indices]
-        return self._node.engine.DictationContainer(translated_words)    
+        return self._container("command", True)
+    
+    def _bounds(self, part):
+        # the range of formatted word indices making up the part
+        command_index = self._command_index or 0
+        if part == "dictation":
+            return 0, command_index
+        elif part == "command":
+            return command_index, len(self._words)
+        return 0, len(self._words)
+    
+    def _raw_bounds(self, part):
+        # the same range, as applied to the raw words
+        raw_boundaries = self._alignment()[0]
+        start, end = self._bounds(part)
+        return raw_boundaries[start], raw_boundaries[end]
+    
+    def _alignment(self):
+        # Maps each boundary between formatted words to the boundary between
+        # raw words, and the literal tag indices to the raw words they came
+        # from. Formatting may merge, split, or drop words, such as when
+        # formatting directives are spoken, so the formatted words each raw
+        # word accounts for are counted, word by word if that adds up, else
+        # by how many formatted words the raw word adds to the few words
+        # before it, as when "period" is joined to the word it follows. Each
+        # count formats a bounded number of words, so the whole takes time
+        # linear in the utterance. Should neither add up, formatted and raw
+        # words are taken to correspond one to one.
+        return self._memoized("alignment", self._determine_alignment)
+    
+    def _determine_alignment(self):
+        raw_words, words = self._raw_words, self._words
+        if raw_words == words:
+            prefix_counts = range(len(words) + 1)
+            word_counts = [1] * len(raw_words)
+        else:
+            format_count = lambda raw: len(self._engine.DictationContainer(raw).format().split())
+            word_counts = [format_count([raw_word]) for raw_word in raw_words]
+            added_counts = word_counts
+            if sum(word_counts) != len(words):
+                added_counts = []
+                for end in xrange(1, len(raw_words) + 1):
+                    context = raw_words[max(end - 1 - _ALIGNMENT_CONTEXT, 0):end - 1]
+                    added_counts.append(format_count(context + raw_words[end - 1:end]) -
+                                        format_count(context))
+            prefix_counts = [0]
+            for added_count in added_counts:
+                prefix_counts.append(prefix_counts[-1] + added_count)
+            if prefix_counts[-1] != len(words) or min(added_counts or [0]) < 0:
+                raw_boundaries = [min(index, len(raw_words)) for index in xrange(len(words))]
+                return (tuple(raw_boundaries + [len(raw_words)]),
+                        self._literal_tag_indices)
+        
+        # a formatted word starts at the raw word it came from, or at any raw
+        # words before that which come to nothing even on their own; raw
+        # words merged into the formatted word before stay with that word
+        raw_boundaries = []
+        raw_index = 0
+        for index in xrange(len(words)):
+            while prefix_counts[raw_index + 1] <= index:
+                raw_index += 1
+            start = raw_index
+            while (start and prefix_counts[start - 1] == prefix_counts[start]
+                   and not word_counts[start - 1]):
+                start -= 1
+            raw_boundaries.append(start)
+        raw_boundaries.append(len(raw_words))
+        
+        # a raw word is a literal tag if all it became is literal tags
+        raw_tag_indices = frozenset(
+            raw_index for raw_index in xrange(len(raw_words))
+            if prefix_counts[raw_index] < prefix_counts[raw_index + 1] and
+            all(index in self._literal_tag_indices for index
+                in xrange(prefix_counts[raw_index], prefix_counts[raw_index + 1])))
+        return tuple(raw_boundaries), raw_tag_indices
+    
+    def _memoized(self, key, produce):
+        if key not in self._memo:
+            self._memo[key] = produce()
+        return self._memo[key]
+    
+    def _words_list(self, part, trans):
+        def produce():
+            start, end = self._bounds(part)
+            return [self._words[i] for i in xrange(start, end)
+                    if not (trans and i in self._literal_tag_indices)]
+        return self._memoized(("words", part, trans), produce)
+    
+    def _string(self, part, trans):
+        return self._memoized(("string", part, trans),
+                              lambda: " ".join(self._words_list(part, trans)))
+    
+    def _container(self, part, trans):
+        def produce():
+            start, end = self._raw_bounds(part)
+            raw_tag_indices = self._alignment()[1]
+            return self._engine.DictationContainer(
+                [self._raw_words[i] for i in xrange(start, end)
+                 if not (trans and i in raw_tag_indices)])
+        return self._memoized(("container", part, trans), produce)
 
-    @property
-    def _formatted_words_list(self):
-        if getattr(self, "_formatted_words_list_memo", None) is None:
-            self._formatted_words_list_memo = self._node.engine.DictationContainer(self._node.words()).format().split()
-        return self._formatted_words_list_memo
+
+@_timed("format")
+def _format_words(engine, raw_words):
+    return tuple(engine.DictationContainer(raw_words).format().split())
 
 
 class SplitForcedDictation(SplitDictation):
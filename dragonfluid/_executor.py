@@ -0,0 +1,255 @@
+"""
+Running the actions of chained commands off the engine's thread, in order.
+"""
+import itertools
+import threading
+import traceback
+from contextlib import contextmanager
+from timeit import default_timer
+
+from six.moves import queue
+
+from dragonfly import ActionBase
+
+from dragonfluid._instrumentation import _instruments
+
+_chain_ids = itertools.count(1)
+# the chain each thread is processing, if any, and whether the thread is an
+# executor's worker
+_chains = threading.local()
+_handoff = None # the chain of a mimic whose recognition is yet to begin
+_handoff_lock = threading.Lock()
+_pending = {} # chain, to the number of its actions queued or executing
+_pending_changed = threading.Condition()
+
+
+@contextmanager
+def _chain():
+    """
+    Marks the recognition processed within as part of a chain, beginning a
+    new chain unless this thread is already processing one, or a chain has
+    mimicked words not yet recognized. The commands of an utterance are
+    processed within the recognition of its first, or, where an engine
+    recognizes mimicked words later on, within a recognition of their own.
+    """
+    current = getattr(_chains, "current", None)
+    if current is not None:
+        _take_handoff(current) # recognized within the mimic
+        yield
+        return
+    _chains.current = _take_handoff() or next(_chain_ids)
+    try:
+        yield
+    finally:
+        _chains.current = None
+
+
+def _current_chain():
+    return getattr(_chains, "current", None)
+
+
+def _hand_off():
+    """
+    Called before mimicking the next command of a chain, so that the
+    recognition of its words joins the chain.
+    """
+    global _handoff
+    chain = _current_chain()
+    if chain is not None:
+        with _handoff_lock:
+            _handoff = chain
+
+
+@contextmanager
+def _mimicking():
+    """
+    Hands the chain being processed off to the recognition of the words
+    mimicked within, taking it back should the mimic fail.
+    """
+    _hand_off()
+    try:
+        yield
+    except Exception:
+        chain = _current_chain()
+        if chain is not None:
+            _take_handoff(chain)
+        raise
+
+
+def _take_handoff(chain=None):
+    # the chain handed off, now taken, or only the given chain's
+    global _handoff
+    with _handoff_lock:
+        handed = _handoff
+        if handed is not None and chain in (None, handed):
+            _handoff = None
+            return handed
+    return None
+
+
+def _await_chain():
+    """
+    Waits until the actions queued by the chain being processed have been
+    executed, so that processing done in place, rather than queued, follows
+    them. Returns at once on an executor's worker, where it is part of an
+    action being executed.
+    """
+    chain = _current_chain()
+    if chain is None or getattr(_chains, "worker", False):
+        return
+    with _pending_changed:
+        while _pending.get(chain):
+            _pending_changed.wait()
+
+
+def _add_pending(chain, count):
+    with _pending_changed:
+        count += _pending.get(chain, 0)
+        if count > 0:
+            _pending[chain] = count
+        else:
+            _pending.pop(chain, None)
+            _pending_changed.notify_all()
+
+
+class ActionExecutor(object):
+    """
+    Executes the actions of `QuickFluidRule`'s on worker threads rather than
+    the engine's, so that a slow action doesn't hold up the commands chained
+    after it, or the next utterance. Enable it with::
+
+        QuickFluidRule.executor = ActionExecutor()
+
+    The actions of a chain are executed one at a time, in the order spoken.
+    With more than one worker, different chains may execute at the same
+    time. Only the actions of `QuickFluidRule`'s, and of `QuickFluidRules`,
+    are queued. Other dragonfluid rules do their processing on the engine's
+    thread, and in a chain with actions queued before them, they first wait
+    for those actions to be executed, so the chain keeps its order at the
+    cost of holding up the engine for them.
+
+    At most ``max_pending`` actions wait per worker. Once that many are
+    waiting, queueing another waits for room, slowing the engine down to
+    the pace of the actions rather than letting them pile up.
+
+    Actions queued while an action is executing, such as by its mimicking
+    a command, are executed at once, as part of it, rather than queued
+    behind the actions waiting.
+
+    An exception raised by an action is printed, and the actions after it
+    still run.
+    """
+
+    def __init__(self, workers=1, max_pending=64):
+        """
+        :param int workers: The number of worker threads. Each chain is
+            executed by one worker, so that its actions stay in order.
+        :param int max_pending: The most actions waiting per worker.
+        """
+        self._queues = [queue.Queue(max_pending) for _ in range(workers)]
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def submit(self, action, extras, rule=None):
+        """
+        Queues the action to be executed with the extras, as part of the
+        chain being processed on this thread, and returns at once unless
+        the queue is full. A `CancelPendingActions` action is executed at
+        once instead.
+
+        :param rule: The rule the action is for, which its execution time
+            is put down to while `instrumentation <instrumentation>` is
+            enabled.
+        """
+        if isinstance(action, CancelPendingActions):
+            (action._executor or self).cancel()
+            return
+        if getattr(_chains, "worker", False):
+            # part of the action executing, which queueing could deadlock
+            _run_action(action, extras, rule)
+            return
+        if not self._threads:
+            self._start()
+        chain = _current_chain() or next(_chain_ids)
+        _add_pending(chain, 1)
+        self._queues[chain % len(self._queues)].put((action, extras, rule, chain))
+
+    def cancel(self):
+        """
+        Discards the actions waiting to be executed, leaving those already
+        executing to finish. Returns the number discarded.
+        """
+        cancelled = 0
+        for pending in self._queues:
+            while True:
+                try:
+                    chain = pending.get_nowait()[3]
+                except queue.Empty:
+                    break
+                _add_pending(chain, -1)
+                pending.task_done()
+                cancelled += 1
+        return cancelled
+
+    def join(self):
+        """Waits until every action queued so far has been executed."""
+        for pending in self._queues:
+            pending.join()
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for pending in self._queues:
+                thread = threading.Thread(target=self._work, args=(pending,),
+                                          name="dragonfluid action executor")
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self, pending):
+        _chains.worker = True
+        while True:
+            action, extras, rule, chain = pending.get()
+            _chains.current = chain # for the commands the action mimics
+            try:
+                _run_action(action, extras, rule)
+            finally:
+                _chains.current = None
+                _add_pending(chain, -1)
+                pending.task_done()
+
+
+def _run_action(action, extras, rule):
+    try:
+        start = default_timer()
+        action.execute(extras)
+        if _instruments.enabled:
+            _instruments.record("queued_action", default_timer() - start, rule)
+    except Exception:
+        traceback.print_exc()
+
+
+class CancelPendingActions(ActionBase):
+    """
+    An action_ that discards the actions an `ActionExecutor` has waiting,
+    for a "cancel" command. It is executed at once, rather than queued
+    behind them. Example::
+
+        class CancelRules(QuickFluidRules):
+            mapping = {"cancel": CancelPendingActions()}
+
+    """
+
+    def __init__(self, executor=None):
+        """
+        :param executor: The `ActionExecutor` to cancel the actions of. If
+            None, the one the action is submitted to.
+        """
+        ActionBase.__init__(self)
+        self._executor = executor
+
+    def _execute(self, data=None):
+        # reached only when not submitted to an executor
+        if self._executor is not None:
+            self._executor.cancel()
@@ -1,9 +1,192 @@
-from collections import Counter
+import atexit
+import sys
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 
-from dragonfly import Grammar
+from dragonfly import Choice, Grammar
+
+from dragonfluid._dispatch import _Dispatcher
+from dragonfluid._instrumentation import _instruments, _timed
+from dragonfluid._introcache import _IntrosCache
+from dragonfluid._loadprofile import _load_stage, _profiled, profile_load
+from dragonfluid._mappedindex import _MappedIndex, _write_index
+from dragonfluid._persistentmap import _PersistentMap
+from dragonfluid._specparsers import _parse_spec, _parse_specs, _SpecGraphParser
+from dragonfluid._support import _contexts_of, _first_not_none, _safe_kwargs
+from dragonfluid._wordtrie import _IntroAutomaton, _WordTrie, _word_ids
+
+SplitCacheInfo = namedtuple("SplitCacheInfo", "hits misses maxsize currsize")
+Segment = namedtuple("Segment", "kind start end")
+# what registering a rule added to the index, so exactly that is taken out
+_Registration = namedtuple("_Registration", "graph intros contexts")
+
+
+class _BulkLoad(object):
+    """The grammar loads and rule registrations queued by a bulk load."""
+    
+    def __init__(self):
+        self.grammars = [] # to load, in the order first asked
+        self.registrations = OrderedDict() # registry, to rules to register
+    
+    def queue_load(self, grammar):
+        if grammar not in self.grammars:
+            self.grammars.append(grammar)
+    
+    def queue_registration(self, registry, rule):
+        self.registrations.setdefault(registry, []).append(rule)
+    
+    def dequeue_registration(self, registry, rule):
+        # True if the rule was waiting to be registered, and no longer is
+        rules = self.registrations.get(registry, [])
+        if rule in rules:
+            rules[:] = [queued for queued in rules if queued is not rule]
+            return True
+        return False
+
+_bulk_load = None # the bulk load in progress, see RegistryGrammar.bulk_load
+
+
+class _IntroIndex(object):
+    """The intros of a set of rules, as a trie and compact intro graphs."""
+    __slots__ = ("trie", "_graphs", "_automaton")
+    
+    def __init__(self, trie, graphs):
+        self.trie = trie
+        self._graphs = graphs # a list, or a map whose keys are listed as needed
+        self._automaton = None
+    
+    @property
+    def graphs(self):
+        graphs = self._graphs
+        if type(graphs) is not list:
+            graphs = self._graphs = list(graphs)
+        return graphs
+    
+    def find_matches(self, word_ids):
+        """
+        Returns a (start, length) pair for every intro of the trie found in
+        the word ids, by the automaton once `_automaton_builder` has built
+        it, and by walking the trie until then.
+        """
+        automaton = self._automaton
+        if automaton is None:
+            return self.trie.find_matches(word_ids)
+        return automaton.find_matches(word_ids)
+    
+    def build_automaton(self):
+        if self._automaton is None:
+            self._automaton = _IntroAutomaton(self.trie)
+
+
+class _AutomatonBuilder(object):
+    """
+    Builds the command search automatons of registries' indexes on a daemon
+    thread, so that neither registration nor recognition waits on one. Only
+    the newest index asked for by each registry is built, once a burst of
+    registrations has settled, as rules activated on a window switch are.
+    """
+    
+    settle_seconds = 0.05
+    
+    def __init__(self):
+        self._pending = OrderedDict() # registry, to its newest index to build
+        self._requests = 0
+        self._changed = threading.Condition()
+        self._thread = None
+        self._stopped = False
+    
+    def request(self, registry, index):
+        with self._changed:
+            self._pending[registry] = index
+            self._requests += 1
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run,
+                                                name="dragonfluid automaton builder")
+                self._thread.daemon = True
+                self._thread.start()
+            self._changed.notify()
+    
+    def stop(self):
+        # at exit, as a daemon thread waiting with a timeout fails once the
+        # interpreter has begun tearing down modules
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._pending and not self._stopped:
+                    self._changed.wait()
+                requests = None
+                while requests != self._requests and not self._stopped:
+                    requests = self._requests
+                    self._changed.wait(self.settle_seconds)
+                if self._stopped:
+                    return
+                _, index = self._pending.popitem(last=False)
+            index.build_automaton()
+
+_automaton_builder = _AutomatonBuilder()
+atexit.register(_automaton_builder.stop)
+
+
+class _RegistrySnapshot(_IntroIndex):
+    """
+    The rules registered with a `Registry` at one moment, and the index of
+    their intros. A snapshot is never changed once a registry publishes it,
+    so it can be read without a lock; registration publishes a new one in
+    its place.
+    
+    Rules whose grammar or own context doesn't match the foreground window
+    are left out of the index of their scope, see `scoped`.
+    """
+    __slots__ = ("generation", "rules", "intro_graphs", "contexts", "_scoped")
+    
+    def __init__(self, generation, rules, trie, intro_graphs, contexts):
+        _IntroIndex.__init__(self, trie, intro_graphs)
+        self.generation = generation
+        self.rules = rules # _PersistentMap of rule, to its _Registration
+        self.intro_graphs = intro_graphs # _PersistentMap of graph, to rule count
+        self.contexts = contexts # every context of a rule, to its rule count
+        self._scoped = {} # frozenset of the matching contexts, to their index
+    
+    def scoped(self, foreground):
+        """
+        Returns the scope of the foreground window, given as (executable,
+        title, handle), or None if unknown, and the index of the rules in
+        context there. The scope is the frozenset of the contexts matching,
+        or None where every rule is in context. Indexes are cached by scope,
+        so only a window unlike any before costs an index build.
+        """
+        if foreground is None or not self.contexts:
+            return None, self
+        matching = frozenset(context for context in self.contexts
+                             if context.matches(*foreground))
+        if len(matching) == len(self.contexts):
+            return None, self
+        index = self._scoped.get(matching)
+        if index is None:
+            index = self._scoped[matching] = self._build_scoped(matching)
+        return matching, index
+    
+    def _build_scoped(self, matching):
+        trie = _WordTrie()
+        graphs = []
+        for rule, registration in self.rules.iteritems():
+            if not matching.issuperset(registration.contexts):
+                continue
+            if registration.graph is not None:
+                if registration.graph not in graphs:
+                    graphs.append(registration.graph)
+                continue
+            for intro in registration.intros:
+                trie.add(_word_ids.intern(intro.split()))
+        return _IntroIndex(trie, graphs)
 
-from dragonfluid._specparsers import _XmlSpecParser
-from dragonfluid._support import _first_not_none, _safe_kwargs
 
 class Registry(object):
     """
@@ -16,6 +199,11 @@ class Registry(object):
     A registry exposes services regarding inspection and parsing of utterances
     as it relates to its literal tags and currently actively registered
     commands.
+    
+    Rules may be registered and unregistered on one thread while utterances
+    are parsed on others. Each registration change publishes a new snapshot
+    of the registered intros in a single step, and each parse reads one
+    snapshot throughout, so it sees a change entirely or not at all.
     """
     
     literal_tags = ["English", "english", "literal"]
@@ -24,6 +212,29 @@ class Registry(object):
     follows is not a command. Registry object's initialize with these default values.
     """
     
+    intros_enumeration_limit = 10000
+    """
+    The most intros that will be listed for a rule registered with
+    `compact intros <compact_intros>` when they are asked for, beyond which
+    the rest are left out. Registration itself is not limited.
+    """
+    
+    split_cache_size = 256
+    """
+    The number of recent utterance splits each Registry remembers, so that a
+    repeated utterance skips command detection. See `split_cache_info`.
+    """
+    
+    direct_dispatch = False
+    """
+    When True, commands chained to from a `ContinuingRule` are processed
+    directly by the registered rule they belong to, rather than mimicked
+    through the engine, wherever that rule is certain. See
+    `direct dispatch <direct_dispatch>`.
+    """
+    
+    _intros_cache = None # shared by all registries, see enable_intros_cache
+    
     def __init__(self, literal_tags=[], override_tags=False):
         """
         :param literal_tags: These words will function as `literalization
@@ -34,11 +245,24 @@ class Registry(object):
             __init__ will be added to the defaults, otherwise they will
             replace them.
         """
-        self.literal_tags = literal_tags
+        self.literal_tags = list(literal_tags) # not the shared default list
         if not override_tags:
             self.literal_tags += Registry.literal_tags
-        self._registered_commands = Counter()
-        self._command_partials = Counter()
+        # replaced whole, never changed, by registration under _write_lock
+        self._snapshot = _RegistrySnapshot(0, _PersistentMap(), _WordTrie(),
+                                           _PersistentMap(), {})
+        self._write_lock = threading.Lock()
+        self._foreground = None # (executable, title, handle), once known
+        self._last_index = (None, None, None, None) # snapshot, foreground, scope, index
+        self._dispatcher = _Dispatcher(self)
+
+        # splits are cached by generation, which registration changes bump
+        self._literal_tags_changes = 0
+        self._literal_tags_seen = tuple(self.literal_tags)
+        self._split_cache = OrderedDict()
+        self._split_cache_lock = threading.Lock() # never waited on by readers
+        self._split_cache_hits = 0
+        self._split_cache_misses = 0
             
     def translate_literals(self, words_iterable):
         """
@@ -78,7 +302,7 @@ class Registry(object):
         for i, word in words_iterator:
             if word in self.literal_tags:
                 indices.append(i)
-                words_iterator.next() # skip the next i, word pair
+                next(words_iterator, None) # skip the next i, word pair
         
         return indices
     
@@ -87,21 +311,135 @@ class Registry(object):
         Adds the rule to a list of known active rules. Not generally called
         directly by users. For more information see
         the `registration <registration>` concept section.
+        
+        Registering a rule already registered does nothing.
+        
+        During a `bulk load <bulk_loading>`, the rule is only registered as
+        the bulk load ends.
         """
-        intros = self._get_intros(rule)
-        partials = self._get_partials(rule, intros)
-        self._registered_commands.update(intros)
-        self._command_partials.update(partials) 
+        if _bulk_load is not None:
+            _bulk_load.queue_registration(self, rule)
+            return
+        self._register_rules([rule])
+    
+    def _register_rules(self, rules):
+        with self._write_lock:
+            update = _SnapshotUpdate(self._snapshot)
+            for rule in rules:
+                self._add_registration(rule, update)
+            self._publish(update.snapshot())
+    
+    def _publish(self, snapshot):
+        # under _write_lock
+        self._snapshot = snapshot
+        _automaton_builder.request(self, snapshot)
+        with self._split_cache_lock: # held by readers only briefly
+            self._split_cache.clear()
+    
+    @_profiled("register", lambda registry, rule, update: type(rule))
+    def _add_registration(self, rule, update):
+        if rule not in update.rules:
+            graph = self._get_intro_graph(rule)
+            intros = () if graph is not None else tuple(self._get_intros(rule) or ())
+            update.register(rule, _Registration(graph, intros, tuple(_contexts_of(rule))))
  
     def unregister_rule(self, rule):
         """
         Removes the rule from the list of known active rules. Not generally
-        called directly by users.
+        called directly by users. Exactly the intros the rule was registered
+        with are removed, and unregistering a rule not registered does
+        nothing.
+        """
+        if _bulk_load is not None and _bulk_load.dequeue_registration(self, rule):
+            return
+        with self._write_lock:
+            if rule not in self._snapshot.rules:
+                return
+            update = _SnapshotUpdate(self._snapshot)
+            update.unregister(rule)
+            self._publish(update.snapshot())
+    
+    def memory_stats(self):
+        """
+        Returns the size of this registry's index of intros, as a dict of:
+        
+        * **rules** - the number of rules registered
+        * **intros** and **partials** - the number of distinct intros, and
+          of the partial intros they begin with, held as word lists
+        * **compact_graphs** - the number of `compact intros
+          <compact_intros>` graphs, whose intros are not counted
+        * **trie_nodes** - the number of nodes holding the intros and
+          partials, one per distinct word sequence
+        * **words** - the number of distinct words interned by all registries
+        * **bytes** - an estimate of the memory used by the index: the trie,
+          the record of each rule's registration with its intro strings, the
+          compact intros graphs, the command search automaton if built, and
+          the table of words interned, though that is shared by all
+          registries. Rules, spec parses and cached splits are not included.
+        * **longest_intro** - the intro of the most words, including those
+          of compact intros graphs, or None
+        """
+        return self._memory_stats(self._snapshot)
+    
+    def _memory_stats(self, snapshot):
+        intros = partials = nodes = 0
+        size = snapshot.rules.size_in_bytes() + snapshot.intro_graphs.size_in_bytes()
+        stack = [snapshot.trie.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            size += node.size_in_bytes()
+            if node.intro_count > 0:
+                intros += 1
+            if node.partial_count > 0:
+                partials += 1
+            if node.children:
+                stack.extend(node.children.itervalues())
+        automaton = snapshot._automaton
+        if automaton is not None:
+            size += automaton.size_in_bytes()
+        size += _word_ids.size_in_bytes()
+        candidates = [graph.longest_intro() for graph in snapshot.graphs]
+        for registration in snapshot.rules.itervalues():
+            size += sys.getsizeof(registration) + sys.getsizeof(registration.intros)
+            size += sum(sys.getsizeof(intro) for intro in registration.intros)
+            candidates += registration.intros
+        size += sum(graph.size_in_bytes() for graph in snapshot.graphs)
+        longest = None
+        for intro in candidates:
+            if intro and (longest is None or len(intro.split()) > len(longest.split())):
+                longest = intro
+        return {"rules": len(snapshot.rules),
+                "intros": intros,
+                "partials": partials,
+                "compact_graphs": len(snapshot.graphs),
+                "trie_nodes": nodes,
+                "words": len(_word_ids),
+                "bytes": size,
+                "longest_intro": longest}
+    
+    @property
+    def generation(self):
+        """
+        A number that increases whenever rules are registered or unregistered,
+        or the literal tags change.
+        """
+        return self._generation_of(self._snapshot)
+    
+    def _generation_of(self, snapshot):
+        if tuple(self.literal_tags) != self._literal_tags_seen:
+            self._literal_tags_seen = tuple(self.literal_tags)
+            self._literal_tags_changes += 1
+        return snapshot.generation + self._literal_tags_changes
+    
+    def split_cache_info(self):
+        """
+        Returns a SplitCacheInfo named tuple of hits, misses, maxsize and
+        currsize for the cache of utterance splits, in the manner of
+        functools.lru_cache.
         """
-        intros = self._get_intros(rule)
-        partials = self._get_partials(rule, intros)
-        self._registered_commands.subtract(intros)
-        self._command_partials.subtract(partials)
+        return SplitCacheInfo(self._split_cache_hits, self._split_cache_misses,
+                              self.split_cache_size, len(self._split_cache))
     
     def is_registered(self, intro):
         """
@@ -110,50 +448,254 @@ class Registry(object):
         :returns: True if registered, False otherwise
         :rtype: bool
         """ 
-        return self._registered_commands[intro] > 0
+        words = intro.split()
+        snapshot = self._snapshot
+        node = snapshot.trie.find(_word_ids.lookup(words))
+        if node is not None and node.intro_count > 0:
+            return True
+        return any(graph.accepts(words) for graph in snapshot.graphs)
     
     def has_partial(self, partial_command):
         """
         Returns True if the string supplied is an initial substring of a
         registered intro, assuming only full words are supplied.
         """
-        return self._command_partials[partial_command] > 0
+        words = partial_command.split()
+        snapshot = self._snapshot
+        node = snapshot.trie.find(_word_ids.lookup(words))
+        if node is not None and node.partial_count > 0:
+            return True
+        return any(graph.is_partial(words) for graph in snapshot.graphs)
 
     def starts_with_registered(self, words_iterable):
         """
         Returns True if the iterable of strings begins with the words of a
         registered command.
         """
-        running_match = ""
-        words_iterator = iter(words_iterable)
-        for word in words_iterator:
-            if word in self.literal_tags:
-                words_iterator.next()
-                continue
-            
-            if running_match:
-                running_match += " "
-            running_match += word
-            if self.is_registered(running_match):
+        words = list(words_iterable)
+        words = [words[i] for i in self._unescaped_positions(words)]
+        index = self._scoped_index(self._snapshot)
+        node = index.trie.root
+        for word_id in _word_ids.lookup(words):
+            node = node.child(word_id)
+            if node is None:
+                break
+            if node.intro_count > 0:
                 return True
-            elif not self.has_partial(running_match):
-                return False
+            elif node.partial_count <= 0:
+                break
+        return any(graph.starts_with(words) for graph in index.graphs)
+    
+    def export_index(self, path):
+        """
+        Writes the intros registered, and the literal tags, to a read-only
+        index file, for `load_index` to map into memory, in this process or
+        others. The graphs of rules registered with `compact intros
+        <compact_intros>` are written as graphs, so none of their intros are
+        left out, however many they accept. Contexts are not kept, so the
+        loaded index finds every command written, whatever the foreground
+        window.
+        
+        :param string path: The file to write, replaced if it exists.
+        """
+        snapshot = self._snapshot
+        stats = self._memory_stats(snapshot)
+        _write_index(path, snapshot.trie, _word_ids.words_by_id(), snapshot.graphs,
+                     self.literal_tags, stats["rules"], stats["longest_intro"])
+    
+    @staticmethod
+    def load_index(path):
+        """
+        Returns a read-only registry answering from an index file written by
+        `export_index`. The file is mapped into memory and read in place,
+        rather than loaded, so processes loading the same file share one
+        copy of it through the operating system's file cache, and loading
+        takes no time however many intros it holds.
+        
+        The registry takes its literal tags from the file, and splits and
+        segments utterances as the exporting registry did, but raises
+        TypeError if rules are registered or unregistered with it. Its
+        `memory_stats` are those of the exporting registry, but for
+        **words**, the number of distinct words in the file, and **bytes**,
+        the size of the file.
+        
+        :param string path: A file written by `export_index`.
+        :raises ValueError: If the file is not an index file of this
+            version of dragonfluid.
+        """
+        return _MappedRegistry(_MappedIndex(path))
+    
+    @staticmethod
+    def enable_intros_cache(path, max_entries=10000):
+        """
+        Caches the intros parsed from specs in the file at ``path``, so that
+        later sessions skip parsing specs that have not changed. The cache is
+        shared by all registries and is saved at exit, or by
+        `save_intros_cache`.
+        
+        :param string path: The cache file, created if it does not exist. An
+            unreadable or corrupt file is replaced.
+        :param int max_entries: The number of specs to keep, least recently
+            used ones being dropped first.
+        """
+        Registry.save_intros_cache()
+        Registry._intros_cache = _IntrosCache(path, max_entries)
     
-    def _determine_command_index(self, dictation_words):
+    @staticmethod
+    def disable_intros_cache():
+        """Saves and stops using any cache set up by `enable_intros_cache`."""
+        Registry.save_intros_cache()
+        Registry._intros_cache = None
+    
+    @staticmethod
+    def save_intros_cache():
+        """Writes any changes to the intros cache to disk."""
+        if Registry._intros_cache is not None:
+            Registry._intros_cache.save()
+    
+    @_timed("command_index")
+    def _determine_command_index(self, dictation_words, forced_dictation=False):
+        """
+        Returns the index of the first command in the word list, or the word
+        count if there is none. When forced_dictation is True, a command at
+        index 0 is passed over in favor of the next one.
+        """
         if not dictation_words:
             return None
-        
+        snapshot = self._snapshot
+        # keyed by value rather than by snapshot or index, which the cache
+        # would otherwise keep alive
+        key = (tuple(dictation_words), self._generation_of(snapshot),
+               self._scoped(snapshot)[0], forced_dictation)
+        # the cache is skipped, rather than waited on, while another thread
+        # is using it
+        if not self._split_cache_lock.acquire(False):
+            return self._first_command_index(snapshot, dictation_words, forced_dictation)
+        try:
+            command_index = self._split_cache.pop(key, None)
+            if command_index is None:
+                self._split_cache_misses += 1
+                command_index = self._first_command_index(snapshot, dictation_words, forced_dictation)
+            else:
+                self._split_cache_hits += 1
+            self._split_cache[key] = command_index # as most recently used
+            while len(self._split_cache) > self.split_cache_size:
+                self._split_cache.popitem(last=False)
+            return command_index
+        finally:
+            self._split_cache_lock.release()
+    
+    def _first_command_index(self, snapshot, dictation_words, forced_dictation):
+        for index in sorted(self._determine_command_lengths(dictation_words, snapshot)):
+            if index or not forced_dictation:
+                return index
+        return len(dictation_words)
+
+    def _determine_command_indices(self, dictation_words):
+        """
+        Returns, in order, every index of the word list at which a registered
+        intro begins, found in a single pass once the automaton of the index
+        is built. Literal tags and the words they escape are skipped, both as
+        starting points and within intros.
+        """
+        return sorted(self._determine_command_lengths(dictation_words))
+
+    def _determine_command_lengths(self, dictation_words, snapshot=None):
+        """
+        Returns a dict of every index at which a registered intro begins, to
+        the word count spanned by the longest intro beginning there, as of
+        the snapshot given or else the current one.
+        """
+        index = self._scoped_index(snapshot or self._snapshot)
+        positions = self._unescaped_positions(dictation_words)
+        words = [dictation_words[i] for i in positions]
+        # the words are mapped to their ids once, for the automaton
+        matches = index.find_matches(_word_ids.lookup(words))
+        for graph in index.graphs:
+            matches += graph.find_matches(words)
+        lengths = {}
+        for start, length in matches:
+            start, end = positions[start], positions[start + length - 1] + 1
+            lengths[start] = max(lengths.get(start, 0), end - start)
+        return lengths
+
+    def set_foreground(self, executable, title, handle):
+        """
+        Sets the foreground window, so that commands are only found in
+        utterances while their grammar's context, and their rule's, match
+        it. Called by each `RegistryGrammar` as an utterance begins, so not
+        generally called directly by users. Until it is first called, every
+        registered command is found, whatever its context.
+        """
+        self._foreground = (executable, title, handle)
+    
+    def _scoped_index(self, snapshot):
+        return self._scoped(snapshot)[1]
+    
+    def _scoped(self, snapshot):
+        # the scope and index in use for the foreground window, the last
+        # ones kept so that utterances in the same window need not match
+        # contexts
+        foreground = self._foreground
+        last_snapshot, last_foreground, scope, index = self._last_index
+        if last_snapshot is not snapshot or last_foreground != foreground:
+            scope, index = snapshot.scoped(foreground)
+            self._last_index = (snapshot, foreground, scope, index)
+            if index._automaton is None:
+                _automaton_builder.request(self, index)
+        return scope, index
+
+    def _unescaped_positions(self, dictation_words):
+        """
+        Returns the indices of the words that are neither literal tags nor
+        escaped by one.
+        """
+        positions = []
         word_count = len(dictation_words)
-        start_index = 0
-        while start_index < word_count:
-            if dictation_words[start_index] in self.literal_tags:
-                start_index += 2
+        index = 0
+        while index < word_count:
+            if dictation_words[index] in self.literal_tags:
+                index += 2
+                continue
+            positions.append(index)
+            index += 1
+        return positions
+
+    def _dispatch(self, engine, words):
+        """
+        Returns True if the command words were processed directly by the rule
+        they belong to, or False if they are still to be mimicked.
+        """
+        return self.direct_dispatch and self._dispatcher.dispatch(engine, words)
+    
+    def segment(self, words):
+        """
+        Splits a word list into the commands it holds, in a single pass.
+        
+        :param words: A word list, such as the command part of a
+            `SplitDictation`.
+        :returns: A list of Segment named tuples of kind, start and end,
+            with start and end indices as for slicing ``words``. Kind is
+            "dictation" for any words before the first command, and "command"
+            for each command, which runs from its intro to the next command
+            or the end. An intro found within an earlier intro does not begin
+            a command of its own.
+        :rtype: list
+        """
+        segments = []
+        end = 0 # the earliest the next command may begin
+        for start, length in sorted(self._determine_command_lengths(words).iteritems()):
+            if start < end:
                 continue
-            words_iterable = (dictation_words[i] for i in xrange(start_index, word_count))
-            if self.starts_with_registered(words_iterable):
-                return start_index
-            start_index += 1
-        return word_count
+            if segments:
+                segments[-1] = segments[-1]._replace(end=start)
+            elif start:
+                segments.append(Segment("dictation", 0, start))
+            segments.append(Segment("command", start, len(words)))
+            end = start + length
+        if not segments and words:
+            segments.append(Segment("dictation", 0, len(words)))
+        return segments
     
     def _split_dictation(self, dictation):
         return self._split_dictation_words_list(dictation.words)
@@ -167,6 +709,7 @@ class Registry(object):
         return dictation_words_list[:command_index], dictation_words_list[command_index:]
     
     @staticmethod
+    @_profiled("parse_spec", type)
     def _determine_intros(rule):
         """
         Expected to be able to accept any spec as long as it is well-formed:
@@ -174,10 +717,9 @@ class Registry(object):
         - contains no { or } characters
         - outside of <extra> references, contains no < or > characters
         
-        This could be further enhanced to extract string parts from Option elements
-        e.g.    spec = "select <direction> word"
-                extras = (Choice("direction", {"left":"left", "right":"right"}), )
-                ### intros --> ["select right word", "select left word"]
+        Intros stop at the first <extra> reference. Rules with choice_intros
+        set instead carry on through references to Choice elements, see
+        _determine_intro_graph.
         """
         if rule._intros:
             return rule._intros
@@ -185,21 +727,87 @@ class Registry(object):
             intros_spec = _first_not_none(getattr(rule, "_intros_spec", None), getattr(rule, "_spec", None))
             if not intros_spec:
                 return None
-            return Registry._parse_spec(intros_spec)
+            return Registry._spec_intros(intros_spec)
+
+    @staticmethod
+    def _spec_intros(spec):
+        # the intros of a spec, by way of the intros cache when there is one
+        cache = Registry._intros_cache
+        if cache is not None:
+            intros = cache.get(spec)
+            if intros is not None:
+                return intros
+        intros = Registry._parse_spec(spec)
+        if cache is not None and intros is not None:
+            cache.put(spec, intros)
+        return intros
+    
+    @staticmethod
+    @_profiled("parse_spec", type)
+    def _determine_intro_graph(rule):
+        """
+        Returns the graph of the rule's intros. When the rule has
+        choice_intros set, references to its Choice elements become slots
+        accepting any of the Choice's keys, matched with a set lookup per word
+        rather than multiplied out, e.g.
+                spec = "select <direction> word"
+                extras = (Choice("direction", {"left":"left", "right":"right"}), )
+                ### intros --> ["select right word", "select left word"]
+        """
+        intros_spec = _first_not_none(getattr(rule, "_intros_spec", None), getattr(rule, "_spec", None))
+        if not intros_spec:
+            return None
+        slots = None
+        if getattr(rule, "_choice_intros", False):
+            slots = Registry._choice_slots(rule)
+        try:
+            return _SpecGraphParser(intros_spec, slots).get_graph()
+        except:
+            print "Registry could not parse this spec for intros:", intros_spec
+            return None
+    
+    @staticmethod
+    def _choice_slots(rule):
+        # the extra names of the rule's Choice elements, to their keys
+        slots = {}
+        for name, element in (getattr(rule, "_extras", None) or {}).items():
+            if isinstance(element, Choice):
+                choices = getattr(element, "_choices", None)
+                if choices is not None:
+                    slots[name] = list(choices.keys())
+                else:
+                    keys = [getattr(child, "_spec", None) for child in element.children]
+                    if None not in keys:
+                        slots[name] = keys
+        return slots
     
     @staticmethod
-    def _determine_partials(rule, intros=None):
-        partials = []
-        intros = _first_not_none(intros, Registry._get_intros(rule))
-        for intro in intros:
-            position = intro.rfind(" ")
-            while position != -1: # -1 means down to final word, not a partial
-                partials.append(intro[0:position])
-                position = intro.rfind(" ", 0, position)
-        return partials
+    def _get_intro_graph(rule):
+        """
+        Returns the intro graph of a rule registered with compact or choice
+        intros, or None for any other rule.
+        """
+        if (getattr(rule, "_is_registered", False) and not rule._intros
+                and (getattr(rule, "_compact_intros", False)
+                     or getattr(rule, "_choice_intros", False))):
+            if rule._determined_intro_graph is None:
+                rule._determined_intro_graph = Registry._determine_intro_graph(rule)
+            return rule._determined_intro_graph
+        else:
+            return None
     
     @staticmethod
     def _get_intros(rule):
+        """
+        Returns the rule's intros. For a rule registered with compact or
+        choice intros, the graph is what gets registered, and this lists at
+        most `intros_enumeration_limit` of its intros, once per rule.
+        """
+        graph = Registry._get_intro_graph(rule)
+        if graph is not None:
+            if rule._determined_intros is None:
+                rule._determined_intros = graph.get_intros(Registry.intros_enumeration_limit)
+            return rule._determined_intros
         if getattr(rule, "_is_registered", False):
             if not rule._determined_intros:
                 rule._determined_intros = Registry._determine_intros(rule)
@@ -208,22 +816,177 @@ class Registry(object):
             return []
 
     @staticmethod
-    def _get_partials(rule, intros=None):
-        if getattr(rule, "_is_registered", False):
-            if not rule._determined_partials:
-                rule._determined_partials = Registry._determine_partials(rule, intros)
-            return rule._determined_partials
-        else:
-            return []
+    def _parse_spec(spec):
+        return _parse_spec(spec)
     
     @staticmethod
-    def _parse_spec(spec):
-        try:
-            parser = _XmlSpecParser(spec)
-            return parser.get_intros()
-        except:
-            print "Registry could not parse this spec for intros:", spec
-            return None
+    def precompute_intros(rules, processes=None):
+        """
+        Determines the `intros <intros>` of the rules ahead of their
+        registration, parsing their specs in parallel across a pool of
+        processes rather than one at a time as each rule is first
+        registered. Rules whose intros are given, already determined or
+        in the intros cache, and rules with `compact intros
+        <compact_intros>`, are passed over.
+        
+        :param rules: The rules, of which only `RegisteredRule`'s are
+            considered.
+        :param int processes: The size of the pool, by default the number of
+            CPUs. With 1, or too few specs to be worth a pool, the specs are
+            parsed in this process, as they are where the interpreter is
+            embedded, such as in Dragon, where no pool can be started, or
+            its workers don't answer within a minute.
+        :returns: The number of specs parsed.
+        :rtype: int
+        """
+        cache = Registry._intros_cache
+        pending = OrderedDict() # spec, to the rules with it
+        for rule in rules:
+            if (not getattr(rule, "_is_registered", False) or rule._intros
+                    or rule._determined_intros is not None
+                    or rule._compact_intros or rule._choice_intros):
+                continue
+            spec = _first_not_none(rule._intros_spec, getattr(rule, "_spec", None))
+            if not spec:
+                continue
+            intros = cache.get(spec) if cache is not None else None
+            if intros is not None:
+                rule._determined_intros = intros
+            else:
+                pending.setdefault(spec, []).append(rule)
+        specs = list(pending)
+        with _load_stage("precompute_intros"):
+            parsed = _parse_specs(specs, processes)
+        for spec, intros in zip(specs, parsed):
+            if intros is None:
+                continue
+            if cache is not None:
+                cache.put(spec, intros)
+            for rule in pending[spec]:
+                rule._determined_intros = intros
+        return len(specs)
+
+atexit.register(Registry.save_intros_cache)
+
+
+class _MappedRegistry(Registry):
+    """A read-only `Registry` answering from an index file, see `load_index`."""
+    
+    def __init__(self, index):
+        Registry.__init__(self, index.literal_tags, override_tags=True)
+        self._index = index
+    
+    def register_rule(self, rule):
+        raise TypeError("Rules cannot be registered with a registry loaded from an index file")
+    
+    def unregister_rule(self, rule):
+        raise TypeError("Rules cannot be unregistered from a registry loaded from an index file")
+    
+    def memory_stats(self):
+        index = self._index
+        return {"rules": index.rule_count,
+                "intros": index.intro_count,
+                "partials": index.partial_count,
+                "compact_graphs": len(index.graphs),
+                "trie_nodes": index.node_count,
+                "words": index.word_count,
+                "bytes": index.size(),
+                "longest_intro": index.longest_intro}
+    
+    def is_registered(self, intro):
+        words = intro.split()
+        node = self._index.find(words)
+        if node is not None and self._index.node(node)[0] > 0:
+            return True
+        return any(graph.accepts(words) for graph in self._index.graphs)
+    
+    def has_partial(self, partial_command):
+        words = partial_command.split()
+        node = self._index.find(words)
+        if node is not None and self._index.node(node)[1] > 0:
+            return True
+        return any(graph.is_partial(words) for graph in self._index.graphs)
+    
+    def starts_with_registered(self, words_iterable):
+        words = list(words_iterable)
+        words = [words[i] for i in self._unescaped_positions(words)]
+        index = self._index
+        node = 0
+        for word in words:
+            node = index.child(node, word)
+            if node is None:
+                break
+            intro_count, partial_count, _, _ = index.node(node)
+            if intro_count > 0:
+                return True
+            elif partial_count <= 0:
+                break
+        return any(graph.starts_with(words) for graph in index.graphs)
+    
+    def _determine_command_lengths(self, dictation_words, snapshot=None):
+        positions = self._unescaped_positions(dictation_words)
+        words = [dictation_words[i] for i in positions]
+        matches = self._index.find_matches(words)
+        for graph in self._index.graphs:
+            matches += graph.find_matches(words)
+        lengths = {}
+        for start, length in matches:
+            start, end = positions[start], positions[start + length - 1] + 1
+            lengths[start] = max(lengths.get(start, 0), end - start)
+        return lengths
+
+
+class _SnapshotUpdate(object):
+    """
+    Registration changes made to copies of a snapshot's contents, each
+    costing the same however many rules are registered: the tables are
+    persistent maps, and the trie is copied only along the intros changed.
+    """
+    
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self.rules = snapshot.rules
+        self._intro_graphs = snapshot.intro_graphs
+        self._contexts = None # copied when first changed, there being few
+        self._trie_updates = [] # (intro word ids, delta)
+    
+    def register(self, rule, registration):
+        self.rules = self.rules.set(rule, registration)
+        self._apply(registration, 1)
+    
+    def unregister(self, rule):
+        registration = self.rules[rule]
+        self.rules = self.rules.remove(rule)
+        self._apply(registration, -1)
+    
+    def _apply(self, registration, delta):
+        graph = registration.graph
+        if graph is not None:
+            count = self._intro_graphs.get(graph, 0) + delta
+            if count > 0:
+                self._intro_graphs = self._intro_graphs.set(graph, count)
+            else:
+                self._intro_graphs = self._intro_graphs.remove(graph)
+        if registration.contexts and self._contexts is None:
+            self._contexts = dict(self._snapshot.contexts)
+        for context in registration.contexts:
+            count = self._contexts.get(context, 0) + delta
+            if count > 0:
+                self._contexts[context] = count
+            else:
+                del self._contexts[context]
+        for intro in registration.intros:
+            self._trie_updates.append((_word_ids.intern(intro.split()), delta))
+    
+    def snapshot(self):
+        trie = self._snapshot.trie
+        if self._trie_updates:
+            trie = trie.copy_with(self._trie_updates)
+        contexts = self._contexts
+        if contexts is None:
+            contexts = self._snapshot.contexts
+        return _RegistrySnapshot(self._snapshot.generation + 1, self.rules,
+                                 trie, self._intro_graphs, contexts)
 
 
 class RegistryGrammar(Grammar):
@@ -246,6 +1009,7 @@ class RegistryGrammar(Grammar):
         :param \*\*kwargs: Passed safely to dragonfly Grammar_
         """
         self.registry = _first_not_none(registry, Registry())
+        self._deferred_rules = [] # (owner class, rule class, args, kwargs)
         _safe_kwargs(Grammar.__init__, self, name, **kwargs)
 
     # override -- you're not expected to need to know this is in place
@@ -260,12 +1024,118 @@ class RegistryGrammar(Grammar):
             self.registry.unregister_rule(rule)
         Grammar.deactivate_rule(self, rule)
      
+    # override -- you're not expected to need to know this is in place
+    def process_begin(self, executable, title, handle):
+        self.registry.set_foreground(executable, title, handle)
+        return Grammar.process_begin(self, executable, title, handle)
+    
+    # override -- you're not expected to need to know this is in place
+    def load(self):
+        if _bulk_load is not None:
+            _bulk_load.queue_load(self)
+            return
+        return self._load()
+    
+    def _load(self):
+        self._build_deferred_rules()
+        return Grammar.load(self)
+    
     # override -- you're not expected to need to know this is in place
     def unload(self):
         for rule in self._rules:
             # unregister to prevent multiply registered rules during restart
             rule.deactivate()
         Grammar.unload(self)
+    
+    def _defer_rule(self, owner, rule_class, args, kwargs):
+        # the rule is built and added as the grammar loads, see QuickFluidRules
+        self._deferred_rules.append((owner, rule_class, args, kwargs))
+    
+    def _build_deferred_rules(self):
+        deferred_rules, self._deferred_rules = self._deferred_rules, []
+        for owner, rule_class, args, kwargs in deferred_rules:
+            with _load_stage("instantiate", owner):
+                self.add_rule(rule_class(*args, **kwargs))
+    
+    def stats(self):
+        """
+        Returns the timings gathered while `instrumentation <instrumentation>`
+        was enabled, for the rules of this grammar, as a dict of rule name to
+        a dict of stage name to a dict of:
+        
+        * **count** - the number of times the stage was timed
+        * **total_seconds** and **max_seconds** - its total and longest time
+        * **buckets** - a latency histogram, as a list of (upper bound in
+          seconds, count) pairs
+        """
+        return _instruments.stats(self._rules)
+    
+    @staticmethod
+    def enable_instrumentation():
+        """
+        Starts timing the stages of recognition and chaining of all rules,
+        for `stats`.
+        """
+        _instruments.enabled = True
+    
+    @staticmethod
+    def disable_instrumentation():
+        """Stops timing, keeping the timings gathered so far."""
+        _instruments.enabled = False
+    
+    @staticmethod
+    def reset_stats():
+        """Discards the timings gathered so far, for all grammars."""
+        _instruments.reset()
+    
+    @staticmethod
+    @contextmanager
+    def bulk_load(precompute_intros=False, processes=None):
+        """
+        Returns a context manager within which grammars are loaded, and their
+        rules registered, only on leaving it, see `bulk loading
+        <bulk_loading>`. Bulk loads within a bulk load are part of it, and
+        their arguments are ignored.
+        
+        :param bool precompute_intros: If True, the intros of the rules to be
+            registered are parsed in parallel before they are registered,
+            see `Registry.precompute_intros`.
+        :param int processes: Passed to `Registry.precompute_intros`.
+        """
+        global _bulk_load
+        if _bulk_load is not None:
+            yield
+            return
+        bulk_load = _bulk_load = _BulkLoad()
+        try:
+            yield
+        finally:
+            try:
+                for grammar in bulk_load.grammars:
+                    grammar._load() # activations still queue registrations
+            finally:
+                _bulk_load = None
+                if precompute_intros:
+                    Registry.precompute_intros(
+                        [rule for rules in bulk_load.registrations.itervalues() for rule in rules],
+                        processes)
+                for registry, rules in bulk_load.registrations.iteritems():
+                    if rules:
+                        registry._register_rules(rules)
+    
+    @staticmethod
+    def profile_load(top=10, stream=None):
+        """
+        Returns a context manager that profiles the loading of grammars within
+        it, see `load profiling <load_profiling>`.
+        
+        :param int top: The number of slowest rule classes to print on
+            leaving the context, or 0 to print nothing.
+        :param stream: Where to print to, sys.stdout if None.
+        :returns: A context manager, whose profiler has a ``report(top,
+            stream)`` method to print again.
+        """
+        return profile_load(top, stream)
 
 
 class GlobalRegistry(RegistryGrammar):
@@ -0,0 +1,133 @@
+"""
+Opt-in timing of the stages of recognition and chaining, enabled with
+`RegistryGrammar.enable_instrumentation` and read with `RegistryGrammar.stats`.
+"""
+import threading
+from functools import wraps
+from timeit import default_timer
+
+# upper bounds of the histogram buckets, in seconds, the last catching the rest
+BUCKET_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0, float("inf"))
+
+
+class _LatencyHistogram(object):
+    __slots__ = ("count", "total", "longest", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.buckets = [0] * len(BUCKET_BOUNDS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+        for index, bound in enumerate(BUCKET_BOUNDS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+    def as_dict(self):
+        return {"count": self.count,
+                "total_seconds": self.total,
+                "max_seconds": self.longest,
+                "buckets": zip(BUCKET_BOUNDS, self.buckets)}
+
+
+class _Instruments(object):
+    """
+    Latency histograms per rule and stage. Each stage is put down to the rule
+    whose recognition is being processed at the time on the same thread,
+    chained recognitions processed within it going to their own rules, so
+    that `ActionExecutor` workers mimicking alongside the engine's thread
+    are told apart.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._histograms = {} # rule, to a dict of stage to histogram
+        self._lock = threading.Lock() # guards the histograms
+        self._local = threading.local() # the stack of rules of each thread
+
+    @property
+    def _rules(self):
+        # the rules whose recognitions are processing on this thread
+        try:
+            return self._local.rules
+        except AttributeError:
+            rules = self._local.rules = []
+            return rules
+
+    def record(self, stage, seconds, rule=None):
+        if rule is None:
+            rules = self._rules
+            rule = rules[-1] if rules else None
+        with self._lock:
+            stages = self._histograms.setdefault(rule, {})
+            if stage not in stages:
+                stages[stage] = _LatencyHistogram()
+            stages[stage].add(seconds)
+
+    def enter_rule(self, rule):
+        self._rules.append(rule)
+
+    def exit_rule(self):
+        self._rules.pop()
+
+    def stats(self, rules):
+        """Returns a dict of rule name, to stage, to histogram dict."""
+        result = {}
+        with self._lock:
+            for rule in rules:
+                stages = self._histograms.get(rule)
+                if stages:
+                    result[rule.name] = dict((stage, histogram.as_dict())
+                                             for stage, histogram in stages.iteritems())
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+_instruments = _Instruments()
+
+
+def _timed(stage):
+    """
+    A decorator timing each call as the stage, while instrumentation is
+    enabled. While it isn't, each call costs one attribute lookup more.
+    """
+    def decorate(function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            if not _instruments.enabled:
+                return function(*args, **kwargs)
+            start = default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _instruments.record(stage, default_timer() - start)
+        return timed
+    return decorate
+
+
+def _timed_recognition(process_recognition):
+    """
+    Decorates a rule's process_recognition, timing it and putting down the
+    stages timed within it to the rule.
+    """
+    @wraps(process_recognition)
+    def timed(rule, *args, **kwargs):
+        if not _instruments.enabled:
+            return process_recognition(rule, *args, **kwargs)
+        _instruments.enter_rule(rule)
+        start = default_timer()
+        try:
+            return process_recognition(rule, *args, **kwargs)
+        finally:
+            _instruments.record("recognition", default_timer() - start, rule)
+            _instruments.exit_rule()
+    return timed
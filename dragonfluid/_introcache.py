@@ -0,0 +1,96 @@
+"""
+An opt-in on-disk cache of spec to intros expansions, enabled with
+`Registry.enable_intros_cache`.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import six
+
+from dragonfluid._specparsers import _PARSER_VERSION
+
+_CACHE_FORMAT = 1
+
+
+class _IntrosCache(object):
+    """
+    Maps specs to their parsed intros, keyed by a hash of the spec text and
+    the parser version, so that a change to either misses the cache. The
+    least recently used entries are evicted beyond ``max_entries``. A missing,
+    unreadable or corrupt file simply starts an empty cache.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = self._read()
+        self._dirty = False
+
+    def get(self, spec):
+        """Returns the cached intros of the spec, or None on a miss."""
+        key = self._key(spec)
+        intros = self._entries.pop(key, None)
+        if intros is None:
+            return None
+        self._entries[key] = intros # reinsert as most recently used
+        return list(intros)
+
+    def put(self, spec, intros):
+        if not all(_is_portable(text) for text in [spec] + list(intros)):
+            return # would not come back from json as the same strings
+        key = self._key(spec)
+        self._entries.pop(key, None)
+        self._entries[key] = list(intros)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def save(self):
+        """Writes the cache to disk, if it changed since last read or saved."""
+        if not self._dirty:
+            return
+        data = {"format": _CACHE_FORMAT, "entries": list(self._entries.items())}
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as cache_file:
+                json.dump(data, cache_file)
+            if os.path.exists(self.path):
+                os.remove(self.path) # os.rename will not replace on Windows
+            os.rename(temp_path, self.path)
+            self._dirty = False
+        except (IOError, OSError) as error:
+            print "Could not save intros cache to", self.path, error
+
+    def _read(self):
+        entries = OrderedDict()
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("format") == _CACHE_FORMAT:
+                for key, intros in data["entries"]:
+                    if (isinstance(key, six.string_types)
+                            and isinstance(intros, list)
+                            and all(isinstance(intro, six.string_types)
+                                    for intro in intros)):
+                        entries[key] = intros
+        except Exception: # missing or corrupt, start afresh
+            entries.clear()
+        return entries
+
+    @staticmethod
+    def _key(spec):
+        if isinstance(spec, six.text_type):
+            spec = spec.encode("utf-8")
+        return hashlib.sha1("%s\0%s" % (_PARSER_VERSION, spec)).hexdigest()
+
+
+def _is_portable(text):
+    if isinstance(text, six.text_type):
+        return True
+    try:
+        text.decode("ascii")
+        return True
+    except UnicodeDecodeError:
+        return False
@@ -0,0 +1,335 @@
+"""
+Compact word graphs of intros, used by `Registry` for rules registered with
+compact intros rather than a list of every intro.
+"""
+import sys
+
+
+class _IntroGraph(object):
+    """
+    A directed acyclic word graph accepting exactly the intros of a spec.
+    Its size follows the size of the spec rather than the number of intros
+    the spec expands to, as optional and alternative parts are not
+    multiplied out.
+
+    Each state maps words to the set of states that follow, and a walk over
+    a word list tracks the set of states reached so far. A state may also
+    have slots, each a set of words any one of which leads on to the same
+    states, as for the keys of a Choice element.
+    """
+
+    def __init__(self, start, edges, slots, end):
+        self._start = start # frozenset of states
+        self._edges = edges # per state, None or a dict of word to states
+        self._slots = slots # per state, None or a list of (words, states)
+        self._end = end # the accepting state, None if nothing is accepted
+
+    @property
+    def start(self):
+        """The frozenset of states a walk begins from."""
+        return self._start
+
+    @property
+    def end(self):
+        """The accepting state, None if nothing is accepted."""
+        return self._end
+
+    def state_count(self):
+        """Returns the number of states, which are numbered from 0."""
+        return len(self._edges)
+
+    def transitions(self, state):
+        """
+        Returns a dict of each word leading on from the state, to the set of
+        states it leads to, the words of slots included.
+        """
+        transitions = dict(self._edges[state] or {})
+        for slot_words, targets in self._slots[state] or ():
+            for word in slot_words:
+                transitions[word] = targets.union(transitions.get(word, ()))
+        return transitions
+
+    def accepts(self, words):
+        """Returns True if the word list is an intro."""
+        return self._end in self._walk(words)
+
+    def is_partial(self, words):
+        """
+        Returns True if the word list is the beginning of a longer intro.
+        """
+        if not words:
+            return False
+        return any(self._continues(state) for state in self._walk(words))
+
+    def starts_with(self, words):
+        """Returns True if the word list begins with an intro."""
+        states = self._start
+        for word in words:
+            states = self._step(states, word)
+            if self._end in states:
+                return True
+            if not states:
+                return False
+        return False
+
+    def find_starts(self, words):
+        """
+        Returns the sorted indices into the word list at which an intro
+        begins, in a single pass over the words.
+        """
+        return sorted(set(start for start, length in self.find_matches(words)))
+
+    def find_matches(self, words):
+        """
+        Returns a (start, length) pair for every intro found in the word
+        list, in order of where they end, in a single pass over the words.
+        """
+        matches = []
+        active = {} # state reached, to the start indices reaching it
+        for index, word in enumerate(words):
+            for state in self._start:
+                active.setdefault(state, set()).add(index)
+            next_active = {}
+            for state, starts in active.iteritems():
+                for target in self._targets(state, word):
+                    next_active.setdefault(target, set()).update(starts)
+            for start in sorted(next_active.pop(self._end, ())):
+                matches.append((start, index - start + 1))
+            active = next_active
+        return matches
+
+    def get_intros(self, limit):
+        """
+        Returns the intros the graph accepts, as strings, stopping once
+        ``limit`` of them are listed.
+        """
+        intros = []
+        seen = set()
+        stack = [(state, ()) for state in self._start]
+        while stack:
+            state, words = stack.pop()
+            if state == self._end:
+                intro = " ".join(words)
+                if intro not in seen:
+                    if len(intros) == limit:
+                        break
+                    seen.add(intro)
+                    intros.append(intro)
+            for word, targets in (self._edges[state] or {}).iteritems():
+                stack.extend((target, words + (word,)) for target in targets)
+            for slot_words, targets in self._slots[state] or ():
+                stack.extend((target, words + (word,))
+                             for word in sorted(slot_words) for target in targets)
+        return intros
+
+    def longest_intro(self):
+        """Returns an intro of the most words the graph accepts, or None."""
+        longest = {} # state, to the longest word tuple from it to the end
+        def from_state(state):
+            if state not in longest:
+                longest[state] = None # reached again only on another path
+                best = () if state == self._end else None
+                options = [(word, targets) for word, targets
+                           in (self._edges[state] or {}).iteritems()]
+                options += [(min(slot_words), targets) for slot_words, targets
+                            in self._slots[state] or ()]
+                for word, targets in options:
+                    for target in targets:
+                        rest = from_state(target)
+                        if rest is not None and (best is None or len(rest) + 1 > len(best)):
+                            best = (word,) + rest
+                longest[state] = best
+            return longest[state]
+        intros = [intro for intro in map(from_state, self._start) if intro]
+        return " ".join(max(intros, key=len)) if intros else None
+
+    def size_in_bytes(self):
+        """An estimate of the memory the graph uses."""
+        size = sys.getsizeof(self) + sys.getsizeof(self._start)
+        size += sys.getsizeof(self._edges) + sys.getsizeof(self._slots)
+        for edges in self._edges:
+            if edges:
+                size += sys.getsizeof(edges)
+                size += sum(sys.getsizeof(targets) for targets in edges.itervalues())
+        for slots in self._slots:
+            if slots:
+                size += sys.getsizeof(slots)
+                size += sum(sys.getsizeof(slot_words) + sys.getsizeof(targets)
+                            for slot_words, targets in slots)
+        return size
+
+    def _walk(self, words):
+        states = self._start
+        for word in words:
+            states = self._step(states, word)
+            if not states:
+                break
+        return states
+
+    def _step(self, states, word):
+        next_states = set()
+        for state in states:
+            next_states.update(self._targets(state, word))
+        return next_states
+
+    def _continues(self, state):
+        return bool(self._edges[state] or self._slots[state])
+
+    def _targets(self, state, word):
+        edges, slots = self._edges[state], self._slots[state]
+        targets = edges.get(word, ()) if edges else ()
+        if slots:
+            for slot_words, slot_targets in slots:
+                if word in slot_words:
+                    targets = slot_targets.union(targets)
+        return targets
+
+
+class _IntroGraphBuilder(object):
+    """
+    Builds an `_IntroGraph` out of fragments, each a (start, end) pair of
+    states joined by word edges and empty edges. A fragment never accepts the
+    empty word list, and None stands for a fragment accepting nothing.
+    """
+
+    def __init__(self):
+        self._word_edges = [] # per state, a list of (word, target)
+        self._slot_edges = [] # per state, a list of (frozenset of words, target)
+        self._empty_edges = [] # per state, a list of targets
+
+    def words(self, words):
+        """Returns a fragment accepting the non-empty word list."""
+        start = state = self._state()
+        for word in words:
+            target = self._state()
+            self._word_edges[state].append((word, target))
+            state = target
+        return start, state
+
+    def slot(self, words):
+        """Returns a fragment accepting any single one of the words."""
+        start, end = self._state(), self._state()
+        self._slot_edges[start].append((frozenset(words), end))
+        return start, end
+
+    def union(self, fragments):
+        """Returns a fragment accepting what any of the fragments accept."""
+        fragments = [fragment for fragment in fragments if fragment]
+        if len(fragments) < 2:
+            return fragments[0] if fragments else None
+        start, end = self._state(), self._state()
+        for fragment_start, fragment_end in fragments:
+            self._empty_edges[start].append(fragment_start)
+            self._empty_edges[fragment_end].append(end)
+        return start, end
+
+    def sequence(self, items):
+        """
+        Returns a fragment accepting the items one after another, except for
+        the empty word list. Each item is a (fragment, optional) pair, and an
+        optional item may be passed over.
+        """
+        if any(fragment is None and not optional for fragment, optional in items):
+            return None
+        start = self._state()
+        # "none" has passed over every item so far, "some" has matched words
+        none, some = start, None
+        for fragment, optional in items:
+            if fragment is None:
+                continue
+            fragment_start, fragment_end = fragment
+            after = self._state()
+            for state in (none, some):
+                if state is not None:
+                    self._empty_edges[state].append(fragment_start)
+            self._empty_edges[fragment_end].append(after)
+            if optional:
+                if some is not None:
+                    self._empty_edges[some].append(after)
+            else:
+                none = None
+            some = after
+        if some is None:
+            return None
+        return start, some
+
+    def compile(self, fragment):
+        """Returns the `_IntroGraph` accepting what the fragment accepts."""
+        if fragment is None:
+            return _IntroGraph(frozenset(), [], [], None)
+        start, end = fragment
+
+        # only states with word or slot edges, and the end, are kept; empty
+        # edges are folded into the edges leading to them
+        closures = {}
+        kept = lambda state: (bool(self._word_edges[state] or self._slot_edges[state])
+                              or state == end)
+        def closure(state):
+            if state not in closures:
+                reached = set()
+                pending = [state]
+                while pending:
+                    current = pending.pop()
+                    if current not in reached:
+                        reached.add(current)
+                        pending.extend(self._empty_edges[current])
+                closures[state] = frozenset(filter(kept, reached))
+            return closures[state]
+
+        edges = {}
+        slots = {}
+        pending = list(closure(start))
+        while pending:
+            state = pending.pop()
+            if state in edges:
+                continue
+            edges[state] = {}
+            for word, target in self._word_edges[state]:
+                targets = closure(target)
+                edges[state].setdefault(word, set()).update(targets)
+                pending.extend(targets)
+            slots[state] = [(words, closure(target))
+                            for words, target in self._slot_edges[state]]
+            for words, targets in slots[state]:
+                pending.extend(targets)
+
+        # drop states from which the end cannot be reached
+        sources = {}
+        for state, state_edges in edges.iteritems():
+            all_targets = list(state_edges.values())
+            all_targets += [targets for words, targets in slots[state]]
+            for targets in all_targets:
+                for target in targets:
+                    sources.setdefault(target, set()).add(state)
+        leading_to_end = set()
+        pending = [end]
+        while pending:
+            state = pending.pop()
+            if state not in leading_to_end:
+                leading_to_end.add(state)
+                pending.extend(sources.get(state, ()))
+
+        numbers = dict((state, number) for number, state
+                       in enumerate(sorted(leading_to_end)))
+        renumber = lambda states: frozenset(numbers[state] for state in states
+                                            if state in numbers)
+        compiled_edges = [None] * len(numbers)
+        compiled_slots = [None] * len(numbers)
+        for state, number in numbers.iteritems():
+            state_edges = {}
+            for word, targets in edges.get(state, {}).iteritems():
+                targets = renumber(targets)
+                if targets:
+                    state_edges[word] = targets
+            state_slots = [(words, renumber(targets))
+                           for words, targets in slots.get(state, ())]
+            compiled_edges[number] = state_edges or None
+            compiled_slots[number] = [slot for slot in state_slots if slot[1]] or None
+        return _IntroGraph(renumber(closure(start)), compiled_edges,
+                           compiled_slots, numbers[end])
+
+    def _state(self):
+        self._word_edges.append([])
+        self._slot_edges.append([])
+        self._empty_edges.append([])
+        return len(self._word_edges) - 1
@@ -0,0 +1,195 @@
+"""
+An opt-in profiler of grammar loading, attributing wall time and memory to
+each rule class and loading stage. It is switched on for the whole process by
+setting the DRAGONFLUID_LOAD_PROFILE environment variable to the number of
+slowest rule classes to print at exit, or around a block of code with
+`RegistryGrammar.profile_load`.
+"""
+import atexit
+import os
+import sys
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+ENVIRONMENT_VARIABLE = "DRAGONFLUID_LOAD_PROFILE"
+
+
+def _memory_in_use():
+    # resident memory in bytes, by the cheapest means at hand, else None
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+class _Cost(object):
+    __slots__ = ("count", "seconds", "memory")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.memory = 0
+
+
+class _Frame(object):
+    __slots__ = ("stage", "owner", "start", "memory", "child_seconds", "child_memory")
+
+    def __init__(self, stage, owner, memory):
+        self.stage = stage
+        self.owner = owner
+        self.memory = memory
+        self.child_seconds = 0.0
+        self.child_memory = 0
+        self.start = default_timer()
+
+
+class _LoadProfiler(object):
+    """
+    Costs per owner and stage, the owner being the rule class being loaded.
+    Stages nest, and each is charged only the time and memory not charged to
+    the stages within it, so that the costs of a rule class add up to its
+    total. A nested stage is owned by the outermost stage with an owner, so
+    the rules a QuickFluidRules class creates are charged to that class.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.costs = {} # owner, to a dict of stage to cost
+        self._frames = []
+
+    def enter(self, stage, owner=None):
+        if self._frames and self._frames[-1].owner is not None:
+            owner = self._frames[-1].owner
+        self._frames.append(_Frame(stage, owner, _memory_in_use()))
+
+    def exit(self):
+        frame = self._frames.pop()
+        seconds = default_timer() - frame.start
+        memory_after = _memory_in_use()
+        memory = 0
+        if frame.memory is not None and memory_after is not None:
+            memory = memory_after - frame.memory
+        cost = self.costs.setdefault(frame.owner, {}).setdefault(frame.stage, _Cost())
+        cost.count += 1
+        cost.seconds += seconds - frame.child_seconds
+        cost.memory += memory - frame.child_memory
+        if self._frames:
+            self._frames[-1].child_seconds += seconds
+            self._frames[-1].child_memory += memory
+
+    def report(self, top=10, stream=None):
+        """Prints the costs of the ``top`` slowest rule classes by stage."""
+        stream = stream or sys.stdout
+        totals = []
+        for owner, stages in self.costs.iteritems():
+            totals.append((sum(cost.seconds for cost in stages.itervalues()),
+                           sum(cost.memory for cost in stages.itervalues()),
+                           _owner_name(owner), stages))
+        totals.sort(reverse=True)
+        stream.write("dragonfluid load profile, %.1f ms in all, slowest %d of %d:\n"
+                     % (sum(total[0] for total in totals) * 1e3, min(top, len(totals)), len(totals)))
+        for seconds, memory, name, stages in totals[:top]:
+            stream.write("%9.1f ms %9.1f KB  %s\n" % (seconds * 1e3, memory / 1024.0, name))
+            for stage, cost in sorted(stages.iteritems(), key=lambda item: -item[1].seconds):
+                stream.write("%9.1f ms %9.1f KB      %s x%d\n" % (
+                    cost.seconds * 1e3, cost.memory / 1024.0, stage, cost.count))
+
+
+def _owner_name(owner):
+    if owner is None:
+        return "(no rule)"
+    return "%s.%s" % (owner.__module__, owner.__name__)
+
+
+_profiler = _LoadProfiler()
+
+
+class _Stage(object):
+    __slots__ = ("profiler", "stage", "owner")
+
+    def __init__(self, profiler, stage, owner):
+        self.profiler = profiler
+        self.stage = stage
+        self.owner = owner
+
+    def __enter__(self):
+        self.profiler.enter(self.stage, self.owner)
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit()
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+_no_stage = _NoStage() # shared, so not profiling costs no allocation
+
+
+def _load_stage(stage, owner=None):
+    """Charges the code in a with block to the stage, while profiling."""
+    profiler = _profiler
+    if not profiler.enabled:
+        return _no_stage
+    return _Stage(profiler, stage, owner)
+
+
+def _profiled(stage, owner_of=None):
+    """
+    A decorator charging each call to the stage, while profiling. The owner is
+    found by calling ``owner_of`` with the call's arguments.
+    """
+    def decorate(function):
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            profiler = _profiler
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            profiler.enter(stage, owner_of(*args) if owner_of else None)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        return profiled
+    return decorate
+
+
+@contextmanager
+def profile_load(top=10, stream=None):
+    """See `RegistryGrammar.profile_load`."""
+    global _profiler
+    profiler = _LoadProfiler()
+    previous, _profiler = _profiler, profiler
+    profiler.enabled = True
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+        if top:
+            profiler.report(top, stream)
+
+
+def _enable_from_environment():
+    value = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not value:
+        return
+    try:
+        top = int(value)
+    except ValueError:
+        top = 10
+    _profiler.enabled = True
+    atexit.register(_profiler.report, top)
+
+_enable_from_environment()
@@ -0,0 +1,290 @@
+"""
+A registry's index of intros as a read-only binary file, written by
+`Registry.export_index` and memory mapped by `Registry.load_index`, so that
+processes loading the same file share its pages rather than each build the
+index.
+"""
+import mmap
+import os
+import struct
+
+import six
+
+from dragonfluid._intrograph import _IntroGraph
+
+_MAGIC = b"DFLUIDX\0"
+_INDEX_FORMAT = 2
+
+# magic, format, rule count, node count, edge count, intro count, partial
+# count, word count, graph count, and the offsets of the strings, nodes,
+# edges, graphs, graph states, graph edges, graph targets and word pool
+_HEADER = struct.Struct("<8s16I")
+# intro count and partial count, as in the trie, then first edge and edge count
+_NODE = struct.Struct("<4I")
+# word offset and length in the pool, then child node
+_EDGE = struct.Struct("<3I")
+# first state, state count, offset and count of the start states in the
+# targets, then the accepting state or _NO_STATE
+_GRAPH = struct.Struct("<5I")
+# first edge and edge count
+_STATE = struct.Struct("<2I")
+# word offset and length in the pool, then offset and count of the states
+# led to in the targets
+_GRAPH_EDGE = struct.Struct("<4I")
+_NUMBER = struct.Struct("<I")
+_NO_STATE = _NO_STRING = 0xFFFFFFFF
+
+# Words are written as the bytes they compare by in the registry that wrote
+# them. A unicode word, or a byte string word of ASCII, is written as UTF-8,
+# as the two compare equal. Any other byte string is written after a 0xFF
+# byte, which UTF-8 never holds, as it never equals a unicode word.
+_BYTES_MARK = b"\xff"
+
+
+def _encoded(word):
+    if isinstance(word, six.text_type):
+        return word.encode("utf-8")
+    try:
+        word.decode("ascii")
+    except UnicodeDecodeError:
+        return _BYTES_MARK + word
+    return word
+
+
+def _decoded(data):
+    if data.startswith(_BYTES_MARK):
+        return data[1:]
+    try:
+        data.decode("ascii")
+    except UnicodeDecodeError:
+        return data.decode("utf-8")
+    return data
+
+
+def _write_index(path, trie, words_by_id, graphs, literal_tags, rule_count,
+                 longest_intro):
+    """
+    Writes the trie, whose words are ids given back as words by
+    ``words_by_id``, the `_IntroGraph` list ``graphs``, the literal tags,
+    and the rule count and longest intro of the registry, to the file at
+    ``path``.
+
+    Nodes are written breadth first, the root first, and the edges of each
+    node sorted by word, so that a word's edge is found by binary search.
+    The states of the graphs are numbered one after the other, each with its
+    edges sorted the same way, the words of slots being written as edges.
+    """
+    pool = bytearray()
+    pool_offsets = {}
+    def pooled(word):
+        if word not in pool_offsets:
+            pool_offsets[word] = len(pool)
+            pool.extend(word)
+        return pool_offsets[word], len(word)
+
+    nodes = []
+    edges = []
+    intro_count = partial_count = 0
+    queue = [trie.root]
+    for node in queue: # appended to while iterating, breadth first
+        children = sorted((_encoded(words_by_id[word_id]), child)
+                          for word_id, child in (node.children or {}).iteritems())
+        nodes.append((max(node.intro_count, 0), max(node.partial_count, 0),
+                      len(edges), len(children)))
+        intro_count += node.intro_count > 0
+        partial_count += node.partial_count > 0
+        for word, child in children:
+            edges.append(pooled(word) + (len(queue),))
+            queue.append(child)
+
+    graph_records = []
+    states = []
+    graph_edges = []
+    targets = []
+    for graph in graphs:
+        first_state = len(states)
+        end = _NO_STATE if graph.end is None else first_state + graph.end
+        graph_records.append((first_state, graph.state_count(), len(targets),
+                              len(graph.start), end))
+        targets.extend(first_state + state for state in sorted(graph.start))
+        for state in xrange(graph.state_count()):
+            transitions = sorted((_encoded(word), state_targets) for word, state_targets
+                                 in graph.transitions(state).iteritems())
+            states.append((len(graph_edges), len(transitions)))
+            for word, state_targets in transitions:
+                graph_edges.append(pooled(word) + (len(targets), len(state_targets)))
+                targets.extend(first_state + target for target in sorted(state_targets))
+
+    strings = bytearray(_NUMBER.pack(len(literal_tags)))
+    for tag in literal_tags:
+        tag = _encoded(tag)
+        strings += _NUMBER.pack(len(tag)) + tag
+    if longest_intro is None:
+        strings += _NUMBER.pack(_NO_STRING)
+    else:
+        longest_intro = _encoded(longest_intro)
+        strings += _NUMBER.pack(len(longest_intro)) + longest_intro
+
+    sections = [strings,
+                b"".join(_NODE.pack(*node) for node in nodes),
+                b"".join(_EDGE.pack(*edge) for edge in edges),
+                b"".join(_GRAPH.pack(*graph) for graph in graph_records),
+                b"".join(_STATE.pack(*state) for state in states),
+                b"".join(_GRAPH_EDGE.pack(*edge) for edge in graph_edges),
+                b"".join(_NUMBER.pack(target) for target in targets),
+                pool]
+    offsets = []
+    offset = _HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(_HEADER.pack(_MAGIC, _INDEX_FORMAT, rule_count, len(nodes),
+                                      len(edges), intro_count, partial_count,
+                                      len(pool_offsets), len(graph_records), *offsets))
+        for section in sections:
+            index_file.write(section)
+    if os.path.exists(path):
+        os.remove(path) # os.rename will not replace on Windows
+    os.rename(temp_path, path)
+
+
+class _MappedIndex(object):
+    """
+    The index in a file written by `_write_index`, read in place from a
+    memory map. Nodes are numbered as written, the root being 0.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = _HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            header = None
+        if header is None or header[0] != _MAGIC or header[1] != _INDEX_FORMAT:
+            self._map.close()
+            raise ValueError("Not a dragonfluid index file of format %d: %s"
+                             % (_INDEX_FORMAT, path))
+        (_, _, self.rule_count, self.node_count, self.edge_count, self.intro_count,
+         self.partial_count, self.word_count, graph_count, strings_offset,
+         self._nodes, self._edges, graphs_offset, self._states,
+         self._graph_edges, self._graph_targets, self._pool) = header
+        count, = _NUMBER.unpack_from(self._map, strings_offset)
+        offset = strings_offset + _NUMBER.size
+        self.literal_tags = []
+        for _ in xrange(count):
+            tag, offset = self._read_string(offset)
+            self.literal_tags.append(tag)
+        self.longest_intro, _ = self._read_string(offset)
+        self.graphs = [_MappedGraph(self, *_GRAPH.unpack_from(self._map, offset))
+                       for offset in xrange(graphs_offset,
+                                            graphs_offset + graph_count * _GRAPH.size,
+                                            _GRAPH.size)]
+
+    def _read_string(self, offset):
+        # the string at the offset, or None, and the offset after it
+        length, = _NUMBER.unpack_from(self._map, offset)
+        offset += _NUMBER.size
+        if length == _NO_STRING:
+            return None, offset
+        return _decoded(self._map[offset:offset + length]), offset + length
+
+    def size(self):
+        return len(self._map)
+
+    def close(self):
+        self._map.close()
+
+    def node(self, node):
+        """Returns the intro count, partial count, first edge and edge count."""
+        return _NODE.unpack_from(self._map, self._nodes + node * _NODE.size)
+
+    def child(self, node, word):
+        """Returns the node reached from the node by the word, or None."""
+        _, _, first, count = self.node(node)
+        edge = self._search(self._edges, _EDGE, first, count, _encoded(word))
+        return None if edge is None else edge[2]
+
+    def targets(self, state, word):
+        """
+        Returns the graph states reached from the graph state by the word,
+        states being numbered across all graphs.
+        """
+        first, count = _STATE.unpack_from(self._map, self._states + state * _STATE.size)
+        edge = self._search(self._graph_edges, _GRAPH_EDGE, first, count, _encoded(word))
+        return () if edge is None else self.numbers(edge[2], edge[3])
+
+    def continues(self, state):
+        """Returns True if any word leads on from the graph state."""
+        return _STATE.unpack_from(self._map, self._states + state * _STATE.size)[1] > 0
+
+    def numbers(self, first, count):
+        """Returns ``count`` graph states listed in the targets from ``first``."""
+        offset = self._graph_targets + first * _NUMBER.size
+        return struct.unpack_from("<%dI" % count, self._map, offset)
+
+    def _search(self, table, record, low, count, word):
+        # the record among those from low whose word, at its start, is the
+        # word given, by binary search
+        high = low + count
+        while low < high:
+            middle = (low + high) // 2
+            found = record.unpack_from(self._map, table + middle * record.size)
+            offset, length = self._pool + found[0], found[1]
+            edge_word = self._map[offset:offset + length]
+            if edge_word == word:
+                return found
+            if edge_word < word:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def find(self, words):
+        """Returns the node reached by walking the words from the root, or None."""
+        node = 0
+        for word in words:
+            node = self.child(node, word)
+            if node is None:
+                return None
+        return node
+
+    def find_matches(self, words):
+        """
+        Returns a (start, length) pair for every intro found in the word
+        list, walking the index from each word in turn.
+        """
+        matches = []
+        for start in xrange(len(words)):
+            node = 0
+            for end in xrange(start, len(words)):
+                node = self.child(node, words[end])
+                if node is None:
+                    break
+                intro_count, partial_count, _, _ = self.node(node)
+                if intro_count > 0:
+                    matches.append((start, end - start + 1))
+                if partial_count <= 0:
+                    break
+        return matches
+
+
+class _MappedGraph(_IntroGraph):
+    """
+    An `_IntroGraph` written by `_write_index`, whose edges are read in
+    place from the index. Its states are numbered across all graphs of the
+    index.
+    """
+
+    def __init__(self, index, first_state, state_count, start, start_count, end):
+        self._index = index
+        self._start = frozenset(index.numbers(start, start_count))
+        self._end = None if end == _NO_STATE else end
+
+    def _continues(self, state):
+        return self._index.continues(state)
+
+    def _targets(self, state, word):
+        return self._index.targets(state, word)
@@ -0,0 +1,147 @@
+"""
+An immutable map, used by `Registry` for the tables of its snapshots, so
+that publishing a registration change costs the same however many rules are
+registered.
+"""
+import sys
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_LEAF_SIZE = 8
+_MAX_SHIFT = 60 # past the bits of a hash, leaves grow as they must
+_EMPTY_NODE = [None] * (1 << _BITS) # copied, never changed
+_MISSING = object()
+
+
+class _PersistentMap(object):
+    """
+    A map that is never changed once built. `set` and `remove` return a new
+    map sharing all but a few nodes with this one, so either costs the same
+    however many keys are held, and anyone still reading this one is
+    undisturbed.
+
+    Keys are spread by hash over a tree of 32 way nodes, each slot of which
+    is empty, another node, or a leaf dict of up to 8 keys.
+    """
+    __slots__ = ("_root", "_length")
+
+    def __init__(self, items=()):
+        self._root = None
+        self._length = 0
+        for key, value in items:
+            self._root = _set(self._root or _EMPTY_NODE, key, value, hash(key), 0)
+            self._length += 1
+
+    def get(self, key, default=None):
+        node = self._root
+        if node is None:
+            return default
+        code = hash(key)
+        shift = 0
+        while True:
+            slot = node[(code >> shift) & _MASK]
+            if slot is None:
+                return default
+            if type(slot) is dict:
+                return slot.get(key, default)
+            node = slot
+            shift += _BITS
+
+    def set(self, key, value):
+        """Returns a copy of the map with the key set to the value."""
+        copy = _PersistentMap()
+        copy._root = _set(self._root or _EMPTY_NODE, key, value, hash(key), 0)
+        copy._length = self._length + (key not in self)
+        return copy
+
+    def remove(self, key):
+        """
+        Returns a copy of the map without the key.
+
+        :raises KeyError: If the key is not in the map.
+        """
+        if key not in self:
+            raise KeyError(key)
+        copy = _PersistentMap()
+        copy._root = _remove(self._root, key, hash(key), 0)
+        copy._length = self._length - 1
+        return copy
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return (key for key, _ in self.iteritems())
+
+    def itervalues(self):
+        return (value for _, value in self.iteritems())
+
+    def iteritems(self):
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            for slot in nodes.pop():
+                if type(slot) is dict:
+                    for item in slot.iteritems():
+                        yield item
+                elif slot is not None:
+                    nodes.append(slot)
+
+    def size_in_bytes(self):
+        """An estimate of the memory the map's own structure uses."""
+        size = sys.getsizeof(self)
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            node = nodes.pop()
+            size += sys.getsizeof(node)
+            for slot in node:
+                if type(slot) is dict:
+                    size += sys.getsizeof(slot)
+                elif slot is not None:
+                    nodes.append(slot)
+        return size
+
+
+def _set(node, key, value, code, shift):
+    # a copy of the node with the key set, copying the nodes along its path
+    node = list(node)
+    index = (code >> shift) & _MASK
+    slot = node[index]
+    if slot is None:
+        node[index] = {key: value}
+    elif type(slot) is dict:
+        leaf = dict(slot)
+        leaf[key] = value
+        if len(leaf) > _LEAF_SIZE and shift < _MAX_SHIFT:
+            child = _EMPTY_NODE
+            for leaf_key, leaf_value in leaf.iteritems():
+                child = _set(child, leaf_key, leaf_value, hash(leaf_key), shift + _BITS)
+            leaf = child
+        node[index] = leaf
+    else:
+        node[index] = _set(slot, key, value, code, shift + _BITS)
+    return node
+
+
+def _remove(node, key, code, shift):
+    # a copy of the node without the key, or None if nothing is left in it
+    node = list(node)
+    index = (code >> shift) & _MASK
+    slot = node[index]
+    if type(slot) is dict:
+        slot = dict(slot)
+        del slot[key]
+        node[index] = slot or None
+    else:
+        node[index] = _remove(slot, key, code, shift + _BITS)
+    if not any(node):
+        return None
+    return node
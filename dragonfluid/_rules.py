@@ -2,7 +2,8 @@ import re
 
 import six
 
-from dragonfly import CompoundRule, Dictation, Function, ActionBase
+from dragonfly import (CompoundRule, Dictation, Function, ActionBase,
+                       Alternative, Compound)
 # locate DictationContainerBase
 import dragonfly.engines
 base_dictation = getattr(dragonfly.engines, "dictation_base", None)
@@ -16,13 +17,30 @@ else:
     raise ImportError
 
 from dragonfluid._elements import SplitDictation, SplitForcedDictation
+from dragonfluid._executor import _await_chain, _chain
+from dragonfluid._grammars import Registry
+from dragonfluid._instrumentation import _timed, _timed_recognition
+from dragonfluid._loadprofile import _load_stage, _profiled
 from dragonfluid._support import _first_not_none, _safe_kwargs
 
 
 class _RegistryRule(CompoundRule):
+    _queues_actions = False # whether its action goes to QuickFluidRule.executor
+
     def __init__(self, **kwargs):
         """kwargs passed to CompoundRule"""
-        _safe_kwargs(CompoundRule.__init__, self, **kwargs)
+        with _load_stage("compile_spec", type(self)):
+            _safe_kwargs(CompoundRule.__init__, self, **kwargs)
+
+    # override -- times the recognition when instrumentation is enabled, and
+    # marks the chain it belongs to for any ActionExecutor, waiting for the
+    # actions the chain queued before processing in place
+    @_timed_recognition
+    def process_recognition(self, node):
+        with _chain():
+            if not self._queues_actions:
+                _await_chain()
+            return CompoundRule.process_recognition(self, node)
 
 
 class RegisteredRule(_RegistryRule):
@@ -35,12 +53,15 @@ class RegisteredRule(_RegistryRule):
     """    
     
     _is_registered = True # requests registration support
+    compact_intros = False
+    choice_intros = False
  
     # memoize variables
     _determined_intros = None
-    _determined_partials = None
+    _determined_intro_graph = None
     
-    def __init__(self, intros=None, intros_spec=None, **kwargs):
+    def __init__(self, intros=None, intros_spec=None, compact_intros=None,
+                 choice_intros=None, **kwargs):
         """
         For information regarding ``intros`` and ``intros_spec``, refer to the
         `intros documentation <intros>`.
@@ -52,6 +73,16 @@ class RegisteredRule(_RegistryRule):
         :type intros: string, string list, or None
         :param string intros_spec: If supplied, will be parsed to obtained the
             intros for the command, similar in manner to how spec is parsed.
+        :param bool compact_intros: If True, the intros are registered as a
+            word graph of the spec or ``intros_spec``, rather than as a list
+            of every intro. See `compact intros <compact_intros>`. Ignored if
+            ``intros`` are supplied. Defaults to the ``compact_intros`` class
+            attribute, which is False unless overridden.
+        :param bool choice_intros: If True, intros carry on through references
+            to Choice_ extras, accepting any of their keys, rather than stop
+            there. Implies ``compact_intros``. Defaults to the
+            ``choice_intros`` class attribute, which is False unless
+            overridden.
         :param \*\*kwargs: passed safely to CompoundRule_
         
         """
@@ -59,6 +90,8 @@ class RegisteredRule(_RegistryRule):
         if isinstance(self._intros, six.string_types):
                 self._intros = [self._intros]
         self._intros_spec = _first_not_none(intros_spec, getattr(self, "intros_spec", None))
+        self._compact_intros = _first_not_none(compact_intros, self.compact_intros)
+        self._choice_intros = _first_not_none(choice_intros, self.choice_intros)
         
         # avoid duplicate processing to speed load time
         if not isinstance(self, FluidRule):
@@ -84,23 +117,27 @@ class ContinuingRule(_RegistryRule):
         _RegistryRule.__init__(self, **kwargs)
 
 
+    @_profiled("alter_rule", lambda rule, *args: type(rule))
     def _alter_rule(self, _spec, _extras):
         if False == getattr(self, "_autoFluidRule_altered", False):
             self._autoFluidRule_altered = True
         else:
             return # don't alter multiple times
 
-        _original_process_recognition = self._process_recognition.im_func
+        _original_process_recognition = _timed("process_recognition")(
+            self._process_recognition.im_func)
         
+        # the chain that follows is split into its commands once, here,
+        # and each command is then processed on its own words
         def _extraadded_flowfull_process_recognition(self, node, extras):
             _original_process_recognition(self, node, extras)
             if self._flow_element in extras: # optional, so maybe not
-                extras[self._flow_element].mimic_full()
+                extras[self._flow_element]._execution_plan(full=True).run()
             
         def _flowcommand_process_recognition(self, node, extras):
             _original_process_recognition(self, node, extras)
             if self._flow_element in extras: # perhaps optional
-                extras[self._flow_element].mimic_command()
+                extras[self._flow_element]._execution_plan().run()
             
         def _autoflowcommand_process_recognition(self, node, extras):
             flow_element = extras.get(self._flow_element, None)
@@ -111,17 +148,10 @@ class ContinuingRule(_RegistryRule):
                 extras[self._flow_element] = flow_element.dictation_container_trans
             _original_process_recognition(self, node, extras)
             if flow_element:
-                flow_element.mimic_command()          
+                flow_element._execution_plan().run()
 
         _extras = dict((extra.name, extra) for extra in _extras)
-        match = re.match(
-            r"""
-            .*                      # any beginning
-            \[?\s*                  # possibly optional extra
-            <(?P<final_extra>.*?)>  # capture extra name as final_extra
-            \s*\]?\s*               # with possible end optional indicator
-            $                       # at the very end of spec
-            """, _spec, re.VERBOSE)
+        match = _final_extra_match(_spec)
 
         if match: # spec ends with an extra
             extra_name = match.group("final_extra")
@@ -150,6 +180,17 @@ class ContinuingRule(_RegistryRule):
         return _spec, extra_name
 
 
+def _final_extra_match(spec):
+    return re.match(
+            r"""
+            .*                      # any beginning
+            \[?\s*                  # possibly optional extra
+            <(?P<final_extra>.*?)>  # capture extra name as final_extra
+            \s*\]?\s*               # with possible end optional indicator
+            $                       # at the very end of spec
+            """, spec, re.VERBOSE)
+
+
 class FluidRule(RegisteredRule, ContinuingRule):
     """
     A FluidRule is both a `RegisteredRule` and a `ContinuingRule`, meaning it
@@ -191,6 +232,14 @@ class QuickFluidRule(FluidRule):
         
     """
     _next_unique_id = 1
+    _queues_actions = True
+    
+    executor = None
+    """
+    If set to an `ActionExecutor`, the actions of all `QuickFluidRule`'s, and
+    of `QuickFluidRules`, are executed by it rather than on the engine's
+    thread.
+    """
 
     def __init__(self, spec, action, args={}, **kwargs):
         """
@@ -211,13 +260,7 @@ class QuickFluidRule(FluidRule):
         
         
         """
-        if isinstance(action, ActionBase) or not six.callable(action):
-            self.action = action
-            self._is_call = False
-        else:
-            self.action = Function(action)
-            self._is_call = True
-
+        self.action, self._is_call = _wrap_action(action)
         self.args = args
         kwargs["spec"] = spec
         kwargs["name"] = self._autogenerate_name(spec)
@@ -229,14 +272,95 @@ class QuickFluidRule(FluidRule):
         return "quickFluidRule_" + spec + "_id" + id_string
             
     def _process_recognition(self, node, extras):
-        if self._is_call:
-            format_candidates = [(name, extra) for name, extra in extras.items() if name not in self.args.keys()]
-            for name, extra in format_candidates:
-                if isinstance(extra, DictationContainerBase):
-                    extras[name] = extra.format()
-        for name, value_callback in self.args.items():
-            extras[name] = value_callback(extras)
-        self.action.execute(extras)
+        _prepare_extras(extras, self._is_call, self.args)
+        self._execute_action(extras)
+    
+    @_timed("action")
+    def _execute_action(self, extras):
+        _execute(self, self.action, extras)
+
+
+def _execute(rule, action, extras):
+    executor = QuickFluidRule.executor
+    if executor is not None:
+        executor.submit(action, extras, rule)
+    else:
+        action.execute(extras)
+
+
+def _wrap_action(action):
+    # the action to execute, and whether it wraps a plain callable
+    if isinstance(action, ActionBase) or not six.callable(action):
+        return action, False
+    return Function(action), True
+
+
+def _prepare_extras(extras, is_call, args):
+    if is_call:
+        format_candidates = [(name, extra) for name, extra in extras.items() if name not in args.keys()]
+        for name, extra in format_candidates:
+            if isinstance(extra, DictationContainerBase):
+                extras[name] = extra.format()
+    for name, value_callback in args.items():
+        extras[name] = value_callback(extras)
+
+
+class _QuickFluidRulesRule(FluidRule):
+    """
+    The entries of a `QuickFluidRules` mapping compiled into a single rule,
+    whose spec is an alternation of the entry specs sharing one set of extras
+    and a single trailing flow element. The alternative recognized routes
+    to the entry's action, and the rule is registered with the intros of
+    every entry, just as the entries' own rules would be.
+    """
+    _next_unique_id = 1
+    _queues_actions = True
+
+    def __init__(self, entries, extras=None, **kwargs):
+        """
+        :param entries: (spec, action) pairs, as in a mapping
+        :param extras: extras shared by the entry specs
+        :param \*\*kwargs: Passed to `FluidRule`, except ``"name"``,
+            ``"spec"`` and ``"intros"`` ignored.
+        """
+        self._entry_extras = dict((extra.name, extra) for extra in extras or [])
+        self._entry_name = "quick_entry"
+        while self._entry_name in self._entry_extras:
+            self._entry_name += "_"
+        self._entries = []
+        alternatives = []
+        intros = []
+        for index, (spec, action) in enumerate(entries):
+            self._entries.append(_wrap_action(action))
+            alternatives.append(Compound(spec, extras=self._entry_extras, value=index))
+            for intro in Registry._spec_intros(spec) or []:
+                if intro not in intros:
+                    intros.append(intro)
+        kwargs["spec"] = "<%s>" % self._entry_name
+        # the shared extras are the rule's too, for their defaults and so
+        # the flow element is named apart from them
+        kwargs["extras"] = ([Alternative(alternatives, name=self._entry_name)]
+                            + self._entry_extras.values())
+        kwargs["intros"] = intros
+        kwargs["name"] = "quickFluidRules_id%d" % _QuickFluidRulesRule._next_unique_id
+        _QuickFluidRulesRule._next_unique_id += 1
+        FluidRule.__init__(self, **kwargs)
+
+    def _process_recognition(self, node, extras):
+        # the entry's extras lie within the alternative, where the shallow
+        # search of CompoundRule stops, so their values are gathered here
+        entry_node = node.get_child_by_name(self._entry_name, shallow=True)
+        action, is_call = self._entries[extras.pop(self._entry_name)]
+        for name in self._entry_extras:
+            extra_node = entry_node.get_child_by_name(name, shallow=True)
+            if extra_node:
+                extras[name] = extra_node.value()
+        _prepare_extras(extras, is_call, {})
+        self._execute_action(action, extras)
+
+    @_timed("action")
+    def _execute_action(self, action, extras):
+        _execute(self, action, extras)
 
 
 class QuickFluidRules(_BaseQuickRules):
@@ -248,7 +372,26 @@ class QuickFluidRules(_BaseQuickRules):
     pairs of spec/action, a value may also be a list or tuple whose first
     element is the usual action, and whose second element is a dict of
     parameters to be passed as \*\*kwargs to `QuickFluidRule`.
+    
+    The ``compact_intros`` and ``choice_intros`` attributes, if set, are
+    passed on to each `QuickFluidRule`.
+    
+    When the ``lazy`` attribute is True and the grammar is a `RegistryGrammar`
+    not yet loaded, each `QuickFluidRule` is only built as the grammar is
+    loaded, so that grammars never loaded cost little more than their
+    mappings. Until then, the rules are not among the grammar's rules.
+    
+    When the ``single_rule`` attribute is True, the entries are compiled into
+    one `FluidRule` whose spec is an alternation of theirs, so the engine
+    grammar holds one rule and one trailing dictation rather than one of each
+    per entry. The intros registered and the actions executed are the same.
+    Entries given parameters of their own, and entries whose spec ends with
+    an extra, still get a `QuickFluidRule` each, as do all entries if
+    ``compact_intros`` or ``choice_intros`` is set.
     """
+    lazy = False
+    single_rule = False
+    
     def __init__(self, grammar):
         """
         Not usually called directly, but rather via `ActiveGrammarRule`.
@@ -257,14 +400,40 @@ class QuickFluidRules(_BaseQuickRules):
             `RegistryGrammar` such as the `GlobalRegistry`.
         """
         _BaseQuickRules.__init__(self, grammar)
+        compiled_entries = []
         for spec, entry in self.mapping.items():
-            kwargs = {}
-            kwargs["extras"] = getattr(self, "extras", None)
-            kwargs["defaults"] = getattr(self, "defaults", None)
-            kwargs["context"] = getattr(self, "context", None)            
+            kwargs = self._rule_kwargs()
             if isinstance(entry, (list, tuple)):             
                 action = entry[0]
                 kwargs.update(entry[1])
             else:
                 action = entry
-            self.add_rule(QuickFluidRule(spec, action, **kwargs))
+            if self._compiles(spec, entry):
+                compiled_entries.append((spec, action))
+            else:
+                self._build_rule(QuickFluidRule, (spec, action), kwargs)
+        if compiled_entries:
+            self._build_rule(_QuickFluidRulesRule, (compiled_entries,), self._rule_kwargs())
+    
+    def _rule_kwargs(self):
+        kwargs = {}
+        kwargs["extras"] = getattr(self, "extras", None)
+        kwargs["defaults"] = getattr(self, "defaults", None)
+        kwargs["context"] = getattr(self, "context", None)            
+        kwargs["compact_intros"] = getattr(self, "compact_intros", None)
+        kwargs["choice_intros"] = getattr(self, "choice_intros", None)
+        return kwargs
+    
+    def _compiles(self, spec, entry):
+        return (self.single_rule
+                and not isinstance(entry, (list, tuple))
+                and not getattr(self, "compact_intros", None)
+                and not getattr(self, "choice_intros", None)
+                and not _final_extra_match(spec))
+    
+    def _build_rule(self, rule_class, args, kwargs):
+        grammar = self._grammer
+        if self.lazy and getattr(grammar, "_defer_rule", None) and not grammar.loaded:
+            grammar._defer_rule(type(self), rule_class, args, kwargs)
+        else:
+            self.add_rule(rule_class(*args, **kwargs))
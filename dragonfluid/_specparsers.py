@@ -1,64 +1,259 @@
-import itertools
-import xml.dom.minidom
+import multiprocessing
+import os
+import re
+import sys
 
+from dragonfluid._intrograph import _IntroGraphBuilder
 from dragonfluid._support import _rstrip_from, _single_spaces_and_trimmed
 
-def _xmlize_spec(spec):
-    spec = spec.replace("<", "{") # "escape" angle brackets
-    spec = spec.replace(">", "}")
+# bumped whenever the intros parsed from a spec may change, which invalidates
+# intros cached on disk
+_PARSER_VERSION = 2
 
-    # optional elements might contain alternatives, e.g., "a [long|short] rule"
-    spec = spec.replace("[", "<optional><alternatives><alternative>")
-    spec = spec.replace("]", "</alternative></alternatives></optional>")
-    
-    spec = spec.replace("(", "<alternatives><alternative>")
-    spec = spec.replace(")", "</alternative></alternatives>")
-    spec = spec.replace("|", "</alternative><alternative>")
+_TOKEN_PATTERN = re.compile(r"[()\[\]|]|[^()\[\]|]+")
+_SLOT_WORD_PATTERN = re.compile(r"\s*[^\s()\[\]|]+\s*$")
 
-    # wrap with alternatives as root, in case of embedded top-level option
-    # e.g. "command one | command two"
-    spec = "<alternatives><alternative>" + spec + "</alternative></alternatives>"    
-    return spec
+# fewer specs than this per process are parsed faster than a pool starts
+_SPECS_PER_PROCESS = 200
+# seconds to wait for a pool, past which its workers are taken to be stuck
+_POOL_TIMEOUT = 60
 
+# intros of already parsed groups and optionals, keyed by their spec text,
+# shared across specs as they often repeat, e.g. "[please]"
+_group_memo = {}
+_GROUP_MEMO_LIMIT = 20000
 
-class _XmlSpecNode:
-    TEXT_NODE = 3
 
-    def __init__(self, node):
-        self.node = xml.dom.minidom.parseString(node)
+def _tokenize(spec):
+    """
+    Returns the tokens of the spec, each a structural character or a run of
+    text, along with a dict mapping the index of each opening token to the
+    index of its closing token.
+    """
+    tokens = []
+    closings = {}
+    openings = [] # stack of indices of unclosed opening tokens
+    for match in _TOKEN_PATTERN.finditer(spec):
+        token = match.group()
+        if token in ("(", "["):
+            openings.append(len(tokens))
+        elif token in (")", "]"):
+            if not openings or tokens[openings[-1]] + token not in ("()", "[]"):
+                raise ValueError("unbalanced %r at %d" % (token, match.start()))
+            closings[openings.pop()] = len(tokens)
+        elif token != "|":
+            # extra references are cut from intros, see _finish
+            token = token.replace("<", "{").replace(">", "}")
+        tokens.append(token)
+    if openings:
+        raise ValueError("unclosed %r" % tokens[openings[-1]])
+    return tokens, closings
+
+
+def _product(intros, new_intros):
+    return [intro + " " + new_intro for intro in intros for new_intro in new_intros]
+
+
+def _finish(intros):
+    # cut at the first extra, normalize spacing, and drop empty intros
+    intros = (_single_spaces_and_trimmed(_rstrip_from(intro, "{")) for intro in intros)
+    return [intro for intro in intros if intro]
+
+
+class _SpecParser(object):
+    """
+    Determines the intros of a spec in a single pass over its tokens, by
+    recursive descent.
+
+    Each sequence of items is expanded into the product of its items' intros,
+    cut short at the first <extra> reference, with empty intros dropped. A
+    group contributes the intros of all its alternatives, and an optional
+    does the same plus the empty string. Alternatives at the top level of the
+    spec, outside any group, are joined as a product as well.
+    """
+
+    def __init__(self, spec):
+        self._tokens, self._closings = _tokenize(spec)
+        self._position = 0
 
     def get_intros(self):
         intros = [""]
-        for child in self.node.firstChild.childNodes:
-            tag = child.nodeName
-            if child.nodeType == _XmlSpecNode.TEXT_NODE:
-                new_intros = [child.nodeValue]
-            elif tag == "alternatives":
-                new_intros = _AlternativesNode(child.toxml()).get_intros()
-            elif tag == "optional":
-                new_intros = [""] + _XmlSpecNode(child.toxml()).get_intros()                        
+        for alternative in self._parse_alternatives():
+            intros = _product(intros, alternative)
+        return _finish(intros)
+
+    def _parse_alternatives(self):
+        alternatives = [self._parse_sequence()]
+        while self._token() == "|":
+            self._position += 1
+            alternatives.append(self._parse_sequence())
+        return alternatives
+
+    def _parse_sequence(self):
+        intros = [""]
+        token = self._token()
+        while token is not None and token not in ("|", ")", "]"):
+            if token in ("(", "["):
+                new_intros = self._parse_group()
             else:
-                new_intros = _XmlSpecNode(child.toxml()).get_intros()
-            new_intros = itertools.product(intros, new_intros)
-            # replace intros with a cartesian product by new_intros
-            intros = [" ".join(parts) for parts in new_intros]
-        intros = map(_rstrip_from, intros, "{" * len(intros))
-        intros = map(_single_spaces_and_trimmed, intros)
-        intros = filter(None, intros) # remove empty intros
+                new_intros = [token]
+                self._position += 1
+            intros = _product(intros, new_intros)
+            token = self._token()
+        return _finish(intros)
+
+    def _parse_group(self):
+        opening = self._position
+        closing = self._closings[opening]
+        key = "".join(self._tokens[opening:closing + 1])
+        intros = _group_memo.get(key)
+        if intros is None:
+            intros = []
+            self._position = opening + 1
+            for alternative in self._parse_alternatives():
+                intros += alternative
+            if self._tokens[opening] == "[":
+                intros = [""] + intros
+            if len(_group_memo) >= _GROUP_MEMO_LIMIT:
+                _group_memo.clear()
+            _group_memo[key] = intros
+        self._position = closing + 1
         return intros
 
+    def _token(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
 
-class _XmlSpecParser(_XmlSpecNode):
-    ""
-    def __init__(self, spec):
-        self._xml_spec = _xmlize_spec(spec)
-        self.node = xml.dom.minidom.parseString(self._xml_spec)
 
+class _SpecGraphParser(object):
+    """
+    Determines the intros of a spec as an `_IntroGraph`, accepting the same
+    intros `_SpecParser` would list, without listing them.
 
-class _AlternativesNode(_XmlSpecNode):
-    def get_intros(self):
-        intros = []
-        for child in self.node.firstChild.childNodes:
-            assert child.nodeName == "alternative" # will only have <alternative> children
-            intros += _XmlSpecNode(child.toxml()).get_intros()
-        return intros
+    Intros are cut short at the first <extra> reference, unless the extra is
+    one of the given slots, a dict of extra names to the specs they accept,
+    such as the keys of a Choice element. Intros then carry on through the
+    slot, which accepts any one of its specs.
+    """
+
+    def __init__(self, spec, slots=None, builder=None):
+        self._tokens, self._closings = _tokenize(spec)
+        self._position = 0
+        self._slots = slots or {}
+        self._builder = builder or _IntroGraphBuilder()
+
+    def get_graph(self):
+        # as with _SpecParser, top level alternatives follow one another
+        items = [(alternative, False) for alternative in self._parse_alternatives()]
+        return self._builder.compile(self._builder.sequence(items))
+
+    def _parse_alternatives(self):
+        alternatives = [self._parse_sequence()]
+        while self._token() == "|":
+            self._position += 1
+            alternatives.append(self._parse_sequence())
+        return alternatives
+
+    def _parse_sequence(self):
+        items = []
+        cut = False # after an extra, words no longer form part of intros
+        token = self._token()
+        while token is not None and token not in ("|", ")", "]"):
+            self._position += 1
+            if token in ("(", "["):
+                fragment = self._builder.union(self._parse_alternatives())
+                self._position += 1 # past the closing token
+                if not cut:
+                    items.append((fragment, token == "["))
+                elif fragment is None and token == "(":
+                    # though cut, a group accepting nothing still spoils all
+                    items.append((None, False))
+            elif not cut:
+                cut = self._parse_text(token, items)
+            token = self._token()
+        return self._builder.sequence(items)
+
+    def _parse_text(self, text, items):
+        # adds the items of the text, returning True if the sequence is cut
+        while text:
+            words, brace, text = text.partition("{")
+            words = words.split()
+            if words:
+                items.append((self._builder.words(words), False))
+            if not brace:
+                break
+            name, closing_brace, text = text.partition("}")
+            fragment = None
+            if closing_brace and name in self._slots:
+                fragment = self._parse_slot(self._slots[name])
+            if fragment is None:
+                return True
+            items.append((fragment, False))
+        return False
+
+    def _parse_slot(self, specs):
+        if any("<" in spec or "{" in spec for spec in specs):
+            return None # not followed into nested extras
+        words = [spec.strip() for spec in specs if _SLOT_WORD_PATTERN.match(spec)]
+        fragments = [self._builder.slot(words)] if words else []
+        for spec in specs:
+            if not _SLOT_WORD_PATTERN.match(spec):
+                # parsed as a group, so that top level alternatives are
+                # alternatives as they are to dragonfly
+                parser = _SpecGraphParser("(" + spec + ")", builder=self._builder)
+                fragments.append(parser._parse_sequence())
+        return self._builder.union(fragments)
+
+    def _token(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
+
+
+# the earlier parser went by way of xml, the name is kept for existing imports
+_XmlSpecParser = _SpecParser
+
+
+def _parse_spec(spec):
+    """
+    Returns the intros of the spec, or None where it can't be parsed. At
+    module level here, away from dragonfly, for a process pool to find.
+    """
+    try:
+        return _SpecParser(spec).get_intros()
+    except:
+        print "Registry could not parse this spec for intros:", spec
+        return None
+
+
+def _parse_specs(specs, processes=None):
+    # the intros of each spec, or None where it can't be parsed
+    if processes is None:
+        try:
+            processes = multiprocessing.cpu_count()
+        except NotImplementedError:
+            processes = 1
+    processes = min(processes, len(specs) // _SPECS_PER_PROCESS)
+    if processes > 1 and _can_start_processes():
+        try:
+            pool = multiprocessing.Pool(processes)
+        except (OSError, ImportError, ValueError):
+            pool = None
+        if pool is not None:
+            try:
+                result = pool.map_async(_parse_spec, specs, len(specs) // (processes * 4) + 1)
+                return result.get(_POOL_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                pass # parsed here instead
+            finally:
+                pool.terminate()
+                pool.join()
+    return [_parse_spec(spec) for spec in specs]
+
+
+def _can_start_processes():
+    # False where the interpreter is embedded, as in Dragon, whose
+    # executable would be started in place of a Python worker
+    executable = os.path.basename(sys.executable or "").lower()
+    return executable.startswith("python")
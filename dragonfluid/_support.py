@@ -3,6 +3,19 @@ support functions - take from a personal library and included in dragonfluid
 """
 import inspect
 
+from dragonfluid._loadprofile import _load_stage
+
+def _contexts_of(rule):
+    # the dragonfly contexts a rule must be in to be spoken; dragonfly keeps
+    # a rule's own context in _context, its class attribute being a default
+    grammar = getattr(rule, "grammar", None)
+    rule_context = getattr(rule, "_context", None)
+    if rule_context is None:
+        rule_context = getattr(rule, "context", None)
+    return [context for context in (getattr(grammar, "_context", None), rule_context)
+            if context is not None]
+
+
 def _first_not_none(*args):
     for arg in args:
         if arg is not None:
@@ -33,10 +46,11 @@ def _safe_kwargs(function, *args, **kwargs):
     Calls the given function, without passing items from kwargs that do not
     match expected named parameters.
     """
-    validargs = inspect.getargspec(function).args
-    removals = [key for key in kwargs.keys() if key not in validargs]
-    for removal in removals:
-        del kwargs[removal]
+    with _load_stage("safe_kwargs"):
+        validargs = inspect.getargspec(function).args
+        removals = [key for key in kwargs.keys() if key not in validargs]
+        for removal in removals:
+            del kwargs[removal]
     return function(*args, **kwargs)
 
 def _single_spaces_and_trimmed(some_string):
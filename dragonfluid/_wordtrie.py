@@ -0,0 +1,277 @@
+"""
+A reference counted word trie, used by `Registry` to index command intros.
+"""
+import sys
+import threading
+
+from dragonfluid._persistentmap import _PersistentMap
+
+UNKNOWN_WORD = None # the id of every word not interned, found in no intro
+
+
+class _WordIds(object):
+    """
+    Interns words as integer ids, so the tries of all registries hold each
+    distinct word once and are walked by integer. Ids are never forgotten,
+    and UNKNOWN_WORD stands for any word not interned.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def intern(self, words):
+        """Returns the words as a tuple of ids, giving new words new ids."""
+        ids = self._ids
+        with self._lock:
+            for word in words:
+                if word not in ids:
+                    ids[word] = len(ids) + 1
+        return tuple(ids[word] for word in words)
+
+    def lookup(self, words):
+        """Returns the words as a list of ids, with UNKNOWN_WORD for new ones."""
+        return map(self._ids.get, words) # UNKNOWN_WORD being None
+
+    def words_by_id(self):
+        """Returns a dict of each id to its word."""
+        with self._lock:
+            return dict((word_id, word) for word, word_id in self._ids.iteritems())
+
+    def __len__(self):
+        return len(self._ids)
+
+    def size_in_bytes(self):
+        """An estimate of the memory the table of words and ids uses."""
+        with self._lock:
+            return sys.getsizeof(self._ids) + sum(
+                sys.getsizeof(word) + sys.getsizeof(word_id)
+                for word, word_id in self._ids.iteritems())
+
+_word_ids = _WordIds() # shared by all registries
+
+# nodes with more children than this hold them in a _PersistentMap, so that
+# copying such a node, as the root usually is, doesn't copy them all
+_DICT_CHILDREN = 32
+
+
+class _WordTrieNode(object):
+    __slots__ = ("children", "intro_count", "partial_count")
+
+    def __init__(self):
+        self.children = None # created on first child, most nodes are leaves
+        self.intro_count = 0 # intros ending at this node
+        self.partial_count = 0 # intros continuing beyond this node
+
+    def child(self, word):
+        if self.children is None:
+            return None
+        return self.children.get(word)
+
+    def set_child(self, word, child):
+        children = self.children
+        if children is None:
+            self.children = {word: child}
+        elif type(children) is dict:
+            children[word] = child
+            if len(children) > _DICT_CHILDREN:
+                self.children = _PersistentMap(children.iteritems())
+        else:
+            self.children = children.set(word, child)
+
+    def remove_child(self, word):
+        children = self.children
+        if type(children) is dict:
+            del children[word]
+        else:
+            children = self.children = children.remove(word)
+        if not children:
+            self.children = None
+
+    def copy(self):
+        node = _WordTrieNode()
+        if type(self.children) is dict:
+            node.children = dict(self.children)
+        else:
+            node.children = self.children # None, or never changed
+        node.intro_count = self.intro_count
+        node.partial_count = self.partial_count
+        return node
+
+    def size_in_bytes(self):
+        """An estimate of the memory the node and its table of children use."""
+        children = self.children
+        if type(children) is dict:
+            return sys.getsizeof(self) + sys.getsizeof(children)
+        if children is not None:
+            return sys.getsizeof(self) + children.size_in_bytes()
+        return sys.getsizeof(self)
+
+
+class _WordTrie(object):
+    """
+    Each node stands for one word of an intro, so intros beginning with the
+    same words share the nodes for those words. Words are given as anything
+    hashable, as `Registry` gives the ids of `_WordIds`. Counts are kept per node so
+    that an intro may be added several times and removed as many times again,
+    and nodes no longer in use by any intro are pruned.
+
+    A trie may be updated in place, or copied with `copy_with`, leaving it
+    untouched for anyone still reading it.
+    """
+
+    def __init__(self):
+        self.root = _WordTrieNode()
+
+    def add(self, words, count=1):
+        """Adds the intro given as a word list ``count`` times."""
+        self._update(words, count)
+
+    def remove(self, words, count=1):
+        """Removes the intro given as a word list ``count`` times."""
+        self._update(words, -count)
+
+    def copy_with(self, updates):
+        """
+        Returns a new trie with the (words, delta) updates applied, sharing
+        with this one the nodes they don't touch. Only the nodes along the
+        updated intros are copied.
+        """
+        trie = _WordTrie()
+        trie.root = self.root.copy()
+        copies = set([trie.root]) # nodes belonging to the new trie alone
+        for words, delta in updates:
+            trie._update(words, delta, copies)
+        return trie
+
+    def find(self, words):
+        """Returns the node reached by walking the words, or None."""
+        node = self.root
+        for word in words:
+            node = node.child(word)
+            if node is None:
+                return None
+        return node
+
+    def find_matches(self, words):
+        """
+        Returns a (start, length) pair for every intro found in the word
+        list, walking the trie from each word in turn, as `_IntroAutomaton`
+        finds them in a single pass once built.
+        """
+        matches = []
+        for start in xrange(len(words)):
+            node = self.root
+            for end in xrange(start, len(words)):
+                node = node.child(words[end])
+                if node is None:
+                    break
+                if node.intro_count > 0:
+                    matches.append((start, end - start + 1))
+                if node.partial_count <= 0:
+                    break
+        return matches
+
+    def _update(self, words, delta, copies=None):
+        if not words:
+            return
+        path = [self.root]
+        node = self.root
+        for word in words:
+            child = node.child(word)
+            if child is None:
+                child = _WordTrieNode()
+                node.set_child(word, child)
+                if copies is not None:
+                    copies.add(child)
+            elif copies is not None and child not in copies:
+                child = child.copy()
+                node.set_child(word, child)
+                copies.add(child)
+            path.append(child)
+            node = child
+        # every node before the last is a partial of this intro
+        for node in path[1:-1]:
+            node.partial_count += delta
+        path[-1].intro_count += delta
+
+        # prune nodes left unused, from the end of the intro backwards
+        for depth in xrange(len(words), 0, -1):
+            node = path[depth]
+            if node.intro_count or node.partial_count or node.children:
+                break
+            path[depth - 1].remove_child(words[depth - 1])
+
+
+class _IntroAutomaton(object):
+    """
+    A multi-pattern automaton over word tokens, in the manner of
+    Aho-Corasick, built from a `_WordTrie`. A single left-to-right pass over a
+    word list finds every position at which a registered intro begins.
+    
+    The automaton is a snapshot of the trie when built, and must be rebuilt
+    after the trie changes.
+    """
+
+    def __init__(self, trie):
+        # per state, with state 0 the root: word transitions, failure state,
+        # and the word lengths of the intros ending at the state
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+
+        depths = [0]
+        queue = [(trie.root, 0)]
+        for trie_node, state in queue: # appended to while iterating, breadth first
+            if state and trie_node.partial_count <= 0:
+                continue # as Registry.starts_with_registered, look no deeper
+            for word, trie_child in (trie_node.children or {}).iteritems():
+                if trie_child.intro_count <= 0 and trie_child.partial_count <= 0:
+                    continue
+                child = len(self._goto)
+                self._goto[state][word] = child
+                self._goto.append({})
+                depths.append(depths[state] + 1)
+
+                fail = 0
+                if state:
+                    fail = self._fail[state]
+                    while fail and word not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    fail = self._goto[fail].get(word, 0)
+                self._fail.append(fail)
+
+                outputs = self._outputs[fail]
+                if trie_child.intro_count > 0:
+                    outputs = (depths[child],) + outputs
+                self._outputs.append(outputs)
+                queue.append((trie_child, child))
+
+    def size_in_bytes(self):
+        """An estimate of the memory the automaton's tables use."""
+        size = sum(sys.getsizeof(table) for table in (self._goto, self._fail, self._outputs))
+        size += sum(sys.getsizeof(transitions) for transitions in self._goto)
+        return size + sum(sys.getsizeof(outputs) for outputs in self._outputs if outputs)
+
+    def find_starts(self, words):
+        """
+        Returns the sorted indices into the word list at which an intro
+        begins.
+        """
+        return sorted(set(start for start, length in self.find_matches(words)))
+
+    def find_matches(self, words):
+        """
+        Returns a (start, length) pair for every intro found in the word
+        list, in order of where they end.
+        """
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        matches = []
+        state = 0
+        for end, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for length in outputs[state]:
+                matches.append((end - length + 1, length))
+        return matches
@@ -0,0 +1,36 @@
+import unittest
+
+from dragonfly import AppContext, Function, get_engine
+
+from dragonfluid import GlobalRegistry, QuickFluidRule
+
+
+class DispatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = get_engine("text")
+        self.events = []
+        self.registry = GlobalRegistry.registry
+        self.registry.direct_dispatch = True
+        self.grammar = GlobalRegistry("dispatch test")
+
+    def tearDown(self):
+        self.grammar.unload()
+        del self.registry.direct_dispatch
+
+    def add_rule(self, spec, **kwargs):
+        events = self.events
+        self.grammar.add_rule(QuickFluidRule(spec, Function(lambda: events.append(spec)),
+                                             **kwargs))
+
+    def test_rule_with_own_context_is_not_dispatched(self):
+        self.add_rule("open notes", context=AppContext(executable="notepad"))
+        self.add_rule("open mail")
+        self.grammar.load()
+        self.assertFalse(self.registry._dispatch(self.engine, "open notes".split()))
+        self.assertTrue(self.registry._dispatch(self.engine, "open mail".split()))
+        self.assertEqual(self.events, ["open mail"])
+
+
+if __name__ == "__main__":
+    unittest.main()
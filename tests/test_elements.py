@@ -0,0 +1,96 @@
+import unittest
+
+from dragonfluid import Registry
+from dragonfluid._elements import SplitDictationResult
+
+
+class _Container(object):
+    """
+    Formats as a dictation container might: "\\cap" capitalizes the next
+    word and "\\quiet" comes to nothing, both formatting to nothing on their
+    own, a word beginning "~" is joined to the word before, and hyphens split
+    a word in two.
+    """
+
+    def __init__(self, words):
+        self.words = list(words)
+
+    def format(self):
+        formatted = []
+        capitalize = False
+        for word in self.words:
+            if word == "\\cap":
+                capitalize = True
+            elif word == "\\quiet":
+                pass
+            elif word.startswith("~") and formatted:
+                formatted[-1] += word[1:]
+            else:
+                for part in word.split("-"):
+                    formatted.append(part.capitalize() if capitalize else part)
+                    capitalize = False
+        return " ".join(formatted)
+
+
+class _Engine(object):
+    DictationContainer = _Container
+
+
+class _Rule(object):
+    _is_registered = True
+    _intros_spec = None
+    _determined_intros = None
+
+    def __init__(self, intros):
+        self._intros = intros
+
+
+class AlignmentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.register_rule(_Rule(["save file"]))
+
+    def assertParts(self, raw, dictation, command):
+        result = SplitDictationResult(_Engine(), self.registry, raw.split())
+        self.assertEqual(result.dictation_container.words, dictation.split())
+        self.assertEqual(result.command_container.words, command.split())
+
+    def test_unchanged_words(self):
+        self.assertParts("hello there save file", "hello there", "save file")
+
+    def test_merged_words_stay_with_the_word_they_merge_into(self):
+        self.assertParts("a ~b save file", "a ~b", "save file")
+        self.assertParts("a b ~c save file", "a b ~c", "save file")
+
+    def test_split_words(self):
+        self.assertParts("well-known save file", "well-known", "save file")
+        self.assertParts("hello well-save file", "hello", "well-save file")
+
+    def test_dropped_words_go_with_the_word_after(self):
+        self.assertParts("\\cap hello save file", "\\cap hello", "save file")
+        self.assertParts("hello \\quiet save file", "hello", "\\quiet save file")
+
+    def test_literal_tags(self):
+        result = SplitDictationResult(_Engine(), self.registry,
+                                      "a ~b literal save file".split())
+        self.assertEqual(result.command_index, 4)
+        self.assertEqual(result.full_container_trans.words, "a ~b save file".split())
+
+    def test_merged_words_take_linear_formatting(self):
+        formatted = []
+        class _CountingContainer(_Container):
+            def format(self):
+                formatted.append(len(self.words))
+                return _Container.format(self)
+        class _CountingEngine(object):
+            DictationContainer = _CountingContainer
+        raw = "word ~period " * 200 + "save file"
+        result = SplitDictationResult(_CountingEngine(), self.registry, raw.split())
+        self.assertEqual(result.command_container.words, "save file".split())
+        self.assertEqual(len(result.dictation_container.words), 400)
+        self.assertTrue(sum(formatted) < 10 * len(raw.split()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+from dragonfly import Dictation, Function, get_engine
+
+from dragonfluid import ActionExecutor, FluidRule, GlobalRegistry, QuickFluidRule
+from dragonfluid._rules import DictationContainerBase
+from dragonfluid._support import _safe_kwargs
+
+
+class _DictationContainer(DictationContainerBase):
+    # made from words alone, as dragonfluid makes them
+    def __init__(self, words):
+        _safe_kwargs(DictationContainerBase.__init__, self, words=words, methods=[])
+
+
+class ExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = get_engine("text")
+        self.engine.DictationContainer = _DictationContainer
+        self.events = []
+        self.executor = QuickFluidRule.executor = ActionExecutor(max_pending=1)
+        # the registry fluid rules chain through unless told otherwise
+        self.registry = GlobalRegistry.registry
+        self.registry.direct_dispatch = True
+        self.grammar = GlobalRegistry("executor test")
+
+    def tearDown(self):
+        QuickFluidRule.executor = None
+        self.grammar.unload()
+        del self.registry.direct_dispatch
+        del self.engine.DictationContainer
+
+    def event(self, name, delay=0):
+        def record():
+            time.sleep(delay)
+            self.events.append(name)
+        return Function(record)
+
+    def add_say_rule(self):
+        events = self.events
+        class SayRule(FluidRule):
+            spec = "say <text>"
+            extras = [Dictation("text")]
+            def _process_recognition(self, node, extras):
+                events.append("say " + extras["text"].format())
+        self.grammar.add_rule(SayRule())
+
+    def join(self, timeout=5):
+        joiner = threading.Thread(target=self.executor.join)
+        joiner.daemon = True
+        joiner.start()
+        joiner.join(timeout)
+        self.assertFalse(joiner.is_alive(), "actions still executing")
+
+    def test_chain_in_order_with_rules_not_queued(self):
+        self.grammar.add_rule(QuickFluidRule("press tab", self.event("tab", 0.05)))
+        self.grammar.add_rule(QuickFluidRule("press enter", self.event("enter", 0.05)))
+        self.add_say_rule()
+        self.grammar.load()
+        self.assertTrue(self.registry._dispatch(
+            self.engine, "press tab say one two press enter".split()))
+        self.join()
+        self.assertEqual(self.events, ["tab", "say one two", "enter"])
+
+    def test_mimic_from_worker(self):
+        engine = self.engine
+        space_queued = threading.Event()
+        def mimic():
+            space_queued.wait(5)
+            self.events.append("mimic")
+            engine.mimic("press enter".split())
+            engine.mimic("say HELLO".split())
+        self.grammar.add_rule(QuickFluidRule("press tab", Function(mimic)))
+        self.grammar.add_rule(QuickFluidRule("press enter", self.event("enter")))
+        self.grammar.add_rule(QuickFluidRule("press space", self.event("space")))
+        self.add_say_rule()
+        self.grammar.load()
+        # the space action takes the one place in the queue before tab mimics
+        engine.mimic("press tab".split())
+        engine.mimic("press space".split())
+        space_queued.set()
+        self.join()
+        self.assertEqual(self.events, ["mimic", "enter", "say hello", "space"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from dragonfly import AppContext, Function
+
+from dragonfluid import QuickFluidRule, Registry
+from dragonfluid._grammars import _automaton_builder
+from dragonfluid._support import _contexts_of
+from dragonfluid._wordtrie import _IntroAutomaton, _word_ids
+
+
+class _Rule(object):
+    _is_registered = True
+    _intros_spec = None
+    _determined_intros = None
+    _determined_intro_graph = None
+    _choice_intros = False
+
+    def __init__(self, intros=None, spec=None, compact_intros=False):
+        self._intros = intros
+        self._spec = spec
+        self._compact_intros = compact_intros
+
+
+class MemoryStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.rules = [_Rule(["go up word%d" % index, "go down word%d" % index])
+                      for index in range(50)]
+        self.rules.append(_Rule(spec="(one | two three) [very big] thing <n>",
+                                compact_intros=True))
+
+    def register_all(self):
+        self.registry._register_rules(self.rules)
+        self.registry.register_rule(self.rules[0]) # already registered
+
+    def unregister_all(self):
+        for rule in self.rules:
+            self.registry.unregister_rule(rule)
+            self.registry.unregister_rule(rule) # no longer registered
+
+    def memory_stats(self):
+        # the automaton is counted once built, which the builder thread
+        # would otherwise do at any moment
+        self.registry._snapshot.build_automaton()
+        return self.registry.memory_stats()
+
+    def test_cycles_leave_stats_unchanged(self):
+        # the first cycle interns the words, which are never forgotten
+        self.register_all()
+        self.unregister_all()
+        empty = self.memory_stats()
+        self.register_all()
+        full = self.memory_stats()
+        for _ in range(3):
+            self.unregister_all()
+            self.assertEqual(self.memory_stats(), empty)
+            self.register_all()
+            self.assertEqual(self.memory_stats(), full)
+
+    def test_stats(self):
+        self.register_all()
+        stats = self.registry.memory_stats()
+        self.assertEqual(stats["rules"], 51)
+        self.assertEqual(stats["intros"], 100)
+        self.assertEqual(stats["compact_graphs"], 1)
+        self.assertEqual(stats["longest_intro"], "two three very big thing")
+        self.unregister_all()
+        stats = self.registry.memory_stats()
+        self.assertEqual((stats["rules"], stats["intros"], stats["trie_nodes"],
+                          stats["longest_intro"]), (0, 0, 1, None))
+
+
+class AutomatonTest(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(2)
+        vocabulary = "alpha bravo charlie delta echo".split()
+        self.utterances = [[generator.choice(vocabulary) for _ in range(generator.randint(1, 12))]
+                           for _ in range(200)]
+        self.registry = Registry()
+        self.registry._register_rules([_Rule([" ".join(words[:4])]) for words in self.utterances[:40]])
+
+    def test_trie_walk_matches_automaton(self):
+        index = self.registry._snapshot
+        automaton = _IntroAutomaton(index.trie)
+        for words in self.utterances:
+            word_ids = _word_ids.lookup(words)
+            self.assertEqual(sorted(index.trie.find_matches(word_ids)),
+                             sorted(automaton.find_matches(word_ids)))
+
+    def test_built_on_the_builder_thread(self):
+        snapshot = self.registry._snapshot
+        deadline = time.time() + 5 + _automaton_builder.settle_seconds
+        while snapshot._automaton is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(snapshot._automaton is not None)
+
+
+class ContextTest(unittest.TestCase):
+
+    def test_rule_context_scopes_its_intros(self):
+        notepad = AppContext(executable="notepad")
+        scoped_rule = QuickFluidRule("open file", Function(lambda: None), context=notepad)
+        self.assertEqual(_contexts_of(scoped_rule), [notepad])
+        registry = Registry()
+        registry.register_rule(scoped_rule)
+        registry.register_rule(QuickFluidRule("save file", Function(lambda: None)))
+        words = "open file save file".split()
+        registry.set_foreground("c:\\windows\\notepad.exe", "notes", 1)
+        self.assertEqual(registry._determine_command_indices(words), [0, 2])
+        registry.set_foreground("c:\\office\\winword.exe", "letter", 2)
+        self.assertEqual(registry._determine_command_indices(words), [2])
+
+
+class SplitCacheTest(unittest.TestCase):
+
+    def test_cache_keeps_no_snapshots(self):
+        registry = Registry()
+        rule = _Rule(["open file"])
+        words = "please open file".split()
+        for _ in range(5):
+            registry.register_rule(rule)
+            self.assertEqual(registry._determine_command_index(words), 1)
+            registry.unregister_rule(rule)
+            self.assertEqual(registry.split_cache_info().currsize, 0)
+            self.assertEqual(registry._determine_command_index(words), 3)
+        for key in registry._split_cache:
+            for part in key:
+                self.assertTrue(part is None or isinstance(part, (bool, int, tuple, frozenset)),
+                                part)
+        self.assertEqual(registry.split_cache_info().currsize, 1)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    # a bounded run of benchmarks/stress.py
+
+    utterance = "alpha one and alpha two and alpha three then zulu".split()
+    toggled_starts = set([0, 3, 6])
+    steady_start = 9
+
+    def setUp(self):
+        self.check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(10) # switch threads often
+
+    def tearDown(self):
+        sys.setcheckinterval(self.check_interval)
+
+    def read(self, registry, stop, failures):
+        while not stop.is_set():
+            starts = set(registry._determine_command_lengths(self.utterance))
+            toggled = starts & self.toggled_starts
+            if toggled and toggled != self.toggled_starts or self.steady_start not in starts:
+                failures.append(sorted(starts))
+            index = registry._determine_command_index(self.utterance)
+            if index not in (0, self.steady_start):
+                failures.append(index)
+
+    def write(self, registry, stop, rules):
+        while not stop.is_set():
+            for rule in rules:
+                registry.register_rule(rule)
+            for rule in rules:
+                registry.unregister_rule(rule)
+
+    def test_readers_never_see_a_registration_half_applied(self):
+        registry = Registry()
+        registry.register_rule(_Rule(["zulu"]))
+        stop = threading.Event()
+        failures = []
+        threads = [threading.Thread(target=self.read, args=(registry, stop, failures))
+                   for _ in range(2)]
+        threads.append(threading.Thread(target=self.write, args=(
+            registry, stop, [_Rule(["alpha one", "alpha two", "alpha three"])])))
+        # churns other intros, so updates overlap in the index
+        threads.append(threading.Thread(target=self.write, args=(
+            registry, stop, [_Rule(["alpha one churn %d" % i]) for i in range(20)])))
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(failures[:10], [])
+
+
+class MappedIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry(["literal", "liter\xc3\xa4l"], True)
+        self.registry.register_rule(_Rule([u"caf\xe9 au lait", "open file"]))
+        self.registry.register_rule(_Rule(spec="(a | b | c) (d | e | f) [g] end",
+                                          compact_intros=True))
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "index")
+        # fewer than the compact intros rule has, none of which may be lost
+        limit = Registry.intros_enumeration_limit
+        Registry.intros_enumeration_limit = 2
+        try:
+            self.registry.export_index(self.path)
+        finally:
+            Registry.intros_enumeration_limit = limit
+        self.loaded = Registry.load_index(self.path)
+
+    def tearDown(self):
+        self.loaded._index.close()
+        shutil.rmtree(self.directory)
+
+    def test_compact_intros_past_the_limit(self):
+        for intro in ["a d end", "c f g end", "b e g", "b e g end x"]:
+            self.assertEqual(self.loaded.is_registered(intro),
+                             self.registry.is_registered(intro))
+            self.assertEqual(self.loaded.has_partial(intro),
+                             self.registry.has_partial(intro))
+        self.assertTrue(self.loaded.is_registered("c f g end"))
+
+    def test_words_compare_as_in_the_live_registry(self):
+        for intro in [u"caf\xe9 au lait", "caf\xc3\xa9 au lait"]:
+            self.assertEqual(self.loaded.is_registered(intro),
+                             self.registry.is_registered(intro))
+        for words in [["caf\xc3\xa9", "au", "lait", "open", "file"],
+                      ["x", "liter\xc3\xa4l", "open", "file", "open", "file"],
+                      ["literal", "b", "e", "end", "c", "d", "end"]]:
+            self.assertEqual(self.loaded.segment(words), self.registry.segment(words))
+        self.assertEqual(self.loaded.literal_tags, self.registry.literal_tags)
+        self.assertEqual([type(tag) for tag in self.loaded.literal_tags], [str, str])
+
+    def test_stats(self):
+        stats = self.registry.memory_stats()
+        loaded = self.loaded.memory_stats()
+        self.assertEqual(loaded["words"], 13)
+        self.assertEqual(loaded["bytes"], os.path.getsize(self.path))
+        del stats["words"], stats["bytes"], loaded["words"], loaded["bytes"]
+        self.assertEqual(loaded, stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import unittest
+
+from dragonfluid._instrumentation import _Instruments
+
+
+class _Rule(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class InstrumentsTest(unittest.TestCase):
+
+    def test_stages_go_to_the_rule_of_their_thread(self):
+        instruments = _Instruments()
+        engine_rule, worker_rule = _Rule("engine"), _Rule("worker")
+        entered, recorded = threading.Event(), threading.Event()
+        def work():
+            instruments.enter_rule(worker_rule)
+            entered.set()
+            recorded.wait(5)
+            instruments.record("mimic", 0.001)
+            instruments.exit_rule()
+        instruments.enter_rule(engine_rule)
+        worker = threading.Thread(target=work)
+        worker.start()
+        entered.wait(5)
+        instruments.record("split", 0.002) # while the worker is within its rule
+        recorded.set()
+        worker.join(5)
+        instruments.exit_rule()
+        stats = instruments.stats([engine_rule, worker_rule])
+        self.assertEqual(sorted(stats["engine"]), ["split"])
+        self.assertEqual(sorted(stats["worker"]), ["mimic"])
+
+
+if __name__ == "__main__":
+    unittest.main()
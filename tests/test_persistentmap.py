@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from dragonfluid._persistentmap import _PersistentMap
+
+
+class _Colliding(object):
+    # keys that all hash alike, to fill leaves past the bits of a hash
+
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 7
+
+    def __eq__(self, other):
+        return isinstance(other, _Colliding) and other.name == self.name
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class PersistentMapTest(unittest.TestCase):
+
+    def assertMatches(self, persistent, expected):
+        self.assertEqual(len(persistent), len(expected))
+        self.assertEqual(dict(persistent.iteritems()), expected)
+        for key, value in expected.iteritems():
+            self.assertTrue(key in persistent)
+            self.assertEqual(persistent[key], value)
+
+    def test_random_updates_leave_earlier_maps_unchanged(self):
+        generator = random.Random(5)
+        keys = range(300) + ["word%d" % i for i in range(100)] + [_Colliding(i) for i in range(20)]
+        history = [(_PersistentMap(), {})]
+        for _ in range(3000):
+            persistent, expected = history[-1]
+            key = generator.choice(keys)
+            expected = dict(expected)
+            if key in expected and generator.random() < 0.5:
+                persistent = persistent.remove(key)
+                del expected[key]
+            else:
+                persistent = persistent.set(key, generator.random())
+                expected[key] = persistent[key]
+            history.append((persistent, expected))
+        for persistent, expected in history[::50]:
+            self.assertMatches(persistent, expected)
+
+    def test_removing_all_keys(self):
+        persistent = _PersistentMap((key, key) for key in range(100))
+        for key in range(100):
+            persistent = persistent.remove(key)
+        self.assertMatches(persistent, {})
+        self.assertEqual(persistent.size_in_bytes(), _PersistentMap().size_in_bytes())
+        self.assertRaises(KeyError, persistent.remove, 0)
+        self.assertRaises(KeyError, lambda: persistent[0])
+        self.assertEqual(persistent.get(0, "default"), "default")
+
+
+if __name__ == "__main__":
+    unittest.main()